@@ -1,24 +1,45 @@
 import flask
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, g, stream_with_context
 from flask_cors import CORS
-import jwt
+import json
 import time
-import hmac
-import hashlib
-import base64
-import secrets
 import logging
+import os
+
+import logs
+import metrics
+from bulk import iter_items, UploadError
+from catalog import CatalogCache
+from complaints import ComplaintStore
+from locations import LEVELS, LocationIndex, paginate
+from otp import OtpStore, RateLimited, deliver
+from responses import language, message, respond
+from security import is_operator, require_hmac, require_session, require_signed_upload, generate_jwt_token, generate_hmac_key
 
 app = Flask(__name__)
 CORS(app)
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+logs.setup(app)
 logger = logging.getLogger(__name__)
 
-# Secret keys (in production, use environment variables)
-JWT_SECRET_KEY = secrets.token_hex(32)
-HMAC_SECRET_KEY = secrets.token_hex(32)
+# Latency metrics at /metrics, aggregated across workers
+metrics.setup(app)
+
+# Location hierarchy for lookups and autocomplete; set LOCATION_FILE to load the full dataset
+locations = LocationIndex.load(os.environ.get('LOCATION_FILE'))
+
+# Catalogs are serialized once here; set CATALOG_FILE to serve them from JSON.
+# locationDetails always comes from the location index, in English only.
+catalogs = CatalogCache(os.environ.get('CATALOG_FILE'), extra={
+    'locationDetails': {'en': locations.details()}
+})
+
+# Complaints are persisted to SQLite by a background group-commit writer
+complaints = ComplaintStore()
+
+# OTP codes and send/verify limits, shared by all workers on this host
+otps = OtpStore()
 
 
 
@@ -28,40 +49,12 @@ def home():
         "message": "TRA API Mock Service is running",
         "status": 200
     }), 200
-def generate_jwt_token(phone):
-    """Generate a JWT token for the user"""
-    payload = {
-        'phone': phone,
-        'exp': int(time.time()) + 3600,  # Token expires in 1 hour
-        'iat': int(time.time())
-    }
-    return jwt.encode(payload, JWT_SECRET_KEY, algorithm='HS256')
-
-def generate_hmac_key(phone):
-    """Generate a secure HMAC key"""
-    message = f"{phone}:{int(time.time())}"
-    hmac_digest = hmac.new(
-        HMAC_SECRET_KEY.encode(), 
-        message.encode(), 
-        hashlib.sha256
-    ).digest()
-    return base64.b64encode(hmac_digest).decode()
-
-def verify_hmac(hmac_key, payload, received_hmac):
-    """Verify the HMAC for a given payload"""
-    try:
-        calculated_hmac = hmac.new(
-            hmac_key.encode(), 
-            payload.encode(), 
-            hashlib.sha256
-        )
-        return hmac.compare_digest(
-            base64.b64encode(calculated_hmac.digest()).decode(), 
-            received_hmac
-        )
-    except Exception as e:
-        logger.error(f"HMAC verification error: {e}")
-        return False
+
+def too_many_requests(retry_after):
+    """Response for a phone that has hit its OTP rate limit"""
+    response = message('too_many_attempts')
+    response.headers['Retry-After'] = str(retry_after)
+    return response
 
 @app.route('/cmt/auth/sendLoginOTP', methods=['POST'])
 def send_login_otp():
@@ -69,34 +62,24 @@ def send_login_otp():
     try:
         data = request.get_json()
         phone = data.get('phone')
-        language = request.headers.get('Accept-Language', 'en')
 
         # Validate phone number
         if not phone or len(phone) < 8 or len(phone) > 13:
-            return jsonify({
-                "data": None,
-                "status": 400,
-                "message": "رقم الهاتف غير صالح" if language == 'ar' else "Invalid phone number"
-            }), 400
-
-        # Static OTP for testing
-        otp = "123456"
+            return message('invalid_phone')
+
+        try:
+            code = otps.issue(phone)
+        except RateLimited as e:
+            return too_many_requests(e.retry_after)
+        deliver(phone, code)
         
-        logger.info(f"OTP sent to phone: {phone}")
+        logger.info("OTP sent", extra={'phone': phone})
         
-        return jsonify({
-            "data": None,
-            "status": 200,
-            "message": "تم إرسال رمز التحقق" if language == 'ar' else "OTP sent successfully"
-        }), 200
+        return message('otp_sent')
     
     except Exception as e:
-        logger.error(f"Error in send_login_otp: {e}")
-        return jsonify({
-            "data": None,
-            "status": 500,
-            "message": str(e)
-        }), 500
+        logger.error("Error in send_login_otp: %s", e)
+        return respond(None, 500, str(e))
 
 @app.route('/cmt/auth/loginWithOTP', methods=['POST'])
 def login_with_otp():
@@ -105,184 +88,273 @@ def login_with_otp():
         data = request.get_json()
         phone = data.get('phone')
         otp = data.get('otp')
-        language = request.headers.get('Accept-Language', 'en')
 
         # Validate inputs
         if not phone or not otp:
-            return jsonify({
-                "data": None,
-                "status": 400,
-                "message": "معلومات غير كاملة" if language == 'ar' else "Incomplete information"
-            }), 400
-
-        # Static OTP validation for testing
-        if otp != "123456":
-            return jsonify({
-                "data": None,
-                "status": 401,
-                "message": "رمز التحقق غير صحيح" if language == 'ar' else "Invalid OTP"
-            }), 401
+            return message('incomplete')
+
+        try:
+            verified = otps.verify(phone, otp)
+        except RateLimited as e:
+            return too_many_requests(e.retry_after)
+
+        if not verified:
+            return message('invalid_otp')
 
         # Generate tokens
-        jwt_token = generate_jwt_token(phone)
-        hmac_key = generate_hmac_key(phone)
+        issued_at = int(time.time())
+        jwt_token = generate_jwt_token(phone, issued_at)
+        hmac_key = generate_hmac_key(phone, issued_at)
         
-        logger.info(f"User logged in: {phone}")
+        logger.info("User logged in", extra={'phone': phone})
         
-        return jsonify({
-            "data": {
-                "token": jwt_token,
-                "key": hmac_key
-            },
-            "status": 200,
-            "message": "تم التحقق من المستخدم" if language == 'ar' else "User verified"
-        }), 200
+        return message('user_verified', {
+            "token": jwt_token,
+            "key": hmac_key
+        })
     
     except Exception as e:
-        logger.error(f"Error in login_with_otp: {e}")
-        return jsonify({
-            "data": None,
-            "status": 500,
-            "message": str(e)
-        }), 500
+        logger.error("Error in login_with_otp: %s", e)
+        return respond(None, 500, str(e))
 
 @app.route('/cmt/chatbot/sendLoginOTP', methods=['POST'])
 def chatbot_send_login_otp():
     """Chatbot send login OTP (duplicate of send_login_otp for compatibility)"""
     return send_login_otp()
 
+REQUIRED_COMPLAINT_FIELDS = ['complainProvider', 'serviceType', 'customerType', 'complainType']
+
+def complaint_error(data):
+    """Describe the first missing or non-scalar required field in data, if any"""
+    for field in REQUIRED_COMPLAINT_FIELDS:
+        if field not in data:
+            return f"Missing {field}"
+        if isinstance(data[field], (dict, list)):
+            return f"Invalid {field}"
+    return None
+
 @app.route('/cmt/chatbot/raiseNewComplain', methods=['POST'])
+@require_session
+@require_hmac
 def raise_new_complaint():
     """Raise a new complaint with HMAC verification"""
     try:
-        # Get HMAC details from headers
-        hmac_key = request.headers.get('Hmac-Key')
-        received_hmac = request.headers.get('Hmac')
-        
-        # Get request data
         data = request.get_json()
-        payload = str(data)
-        language = request.headers.get('Accept-Language', 'en')
-
-        # Verify HMAC
-        if not hmac_key or not received_hmac or not verify_hmac(hmac_key, payload, received_hmac):
-            return jsonify({
-                "data": None,
-                "status": 401,
-                "message": "غير مصرح به" if language == 'ar' else "Unauthorized"
-            }), 401
 
         # Validate complaint data
-        required_fields = ['complainProvider', 'serviceType', 'customerType', 'complainType']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({
-                    "data": None,
-                    "status": 400,
-                    "message": f"Missing {field}"
-                }), 400
-
-        logger.info(f"New complaint raised: {data}")
+        error = complaint_error(data)
+        if error:
+            return respond(None, 400, error)
+
+        complaint_id = complaints.add(data, phone=g.session['phone'])
+        logger.info("New complaint raised", extra={
+            'phone': g.session['phone'],
+            'complaint_id': complaint_id,
+            'complain_provider': data['complainProvider'],
+            'complain_type': data['complainType']
+        })
         
-        return jsonify({
-            "data": None,
-            "status": 200,
-            "message": "شكرا ، سيتم النظر في الطلب المقدم" if language == 'ar' else "Thank you, your complaint will be processed"
-        }), 200
+        return message('complaint_received', {"complainId": complaint_id})
     
     except Exception as e:
-        logger.error(f"Error in raise_new_complaint: {e}")
-        return jsonify({
-            "data": None,
-            "status": 500,
-            "message": str(e)
-        }), 500
+        logger.error("Error in raise_new_complaint: %s", e)
+        return respond(None, 500, str(e))
+
+@app.route('/cmt/chatbot/raiseNewComplainBulk', methods=['POST'])
+@require_session
+@require_signed_upload
+def raise_new_complaints_bulk():
+    """Raise complaints from an NDJSON or JSON array upload, streaming per-item results"""
+    upload = g.upload
+    session_phone = g.session['phone']
+
+    def results():
+        accepted = rejected = 0
+        window = []
+
+        def drain():
+            # Results go out in upload order, once their batch is committed
+            nonlocal accepted, rejected
+            for index, outcome in window:
+                if isinstance(outcome, str):
+                    rejected += 1
+                    line = {"index": index, "status": 400, "message": outcome}
+                else:
+                    try:
+                        line = {"index": index, "status": 200, "complainId": outcome.wait()}
+                        accepted += 1
+                    except Exception as e:
+                        rejected += 1
+                        line = {"index": index, "status": 500, "message": str(e)}
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+            window.clear()
+
+        try:
+            for index, item in enumerate(iter_items(upload)):
+                if isinstance(item, UploadError):
+                    window.append((index, str(item)))
+                elif not isinstance(item, dict):
+                    window.append((index, "Invalid complaint"))
+                elif (error := complaint_error(item)):
+                    window.append((index, error))
+                else:
+                    window.append((index, complaints.submit(item, phone=session_phone)))
+                if len(window) >= complaints.batch_size:
+                    yield from drain()
+            yield from drain()
+            logger.info("Bulk complaints raised", extra={
+                'phone': session_phone,
+                'accepted': accepted,
+                'rejected': rejected
+            })
+            yield json.dumps({
+                "data": {"accepted": accepted, "rejected": rejected},
+                "status": 200,
+                "message": ""
+            }) + "\n"
+        except Exception as e:
+            logger.error("Error in raise_new_complaints_bulk: %s", e)
+            yield json.dumps({"data": None, "status": 500, "message": str(e)}) + "\n"
+        finally:
+            upload.close()
+
+    return Response(stream_with_context(results()), mimetype='application/x-ndjson')
+
+MAX_SEARCH_LIMIT = 1000
+
+@app.route('/cmt/chatbot/searchComplaints', methods=['POST'])
+@require_session
+@require_hmac
+def search_complaints():
+    """Search complaints by phone, provider, complaint type and time range.
+
+    Only operators may search other phones; everyone else sees their own complaints.
+    """
+    try:
+        data = request.get_json()
+        if not isinstance(data, dict):
+            return message('invalid_search')
+
+        phone = data.get('phone') if is_operator(g.session) else g.session['phone']
+        try:
+            limit = int(data.get('limit', 100))
+            if not 1 <= limit <= MAX_SEARCH_LIMIT:
+                raise ValueError("Invalid limit")
+            results = complaints.search(
+                phone=phone,
+                complainProvider=data.get('complainProvider'),
+                complainType=data.get('complainType'),
+                since=data.get('from'),
+                until=data.get('to'),
+                limit=limit
+            )
+        except (TypeError, ValueError):
+            return message('invalid_search')
+
+        return respond(results)
+    
+    except Exception as e:
+        logger.error("Error in search_complaints: %s", e)
+        return respond(None, 500, str(e))
 
 @app.route('/cmt/chatbot/getComplaintFields', methods=['POST'])
+@require_session
+@require_hmac
 def get_complaint_fields():
     """Get complaint-related fields"""
     try:
-        # Get HMAC details from headers
-        hmac_key = request.headers.get('Hmac-Key')
-        received_hmac = request.headers.get('Hmac')
-        
-        # Get request data
-        data = request.get_json()
-        payload = str(data)
-        language = request.headers.get('Accept-Language', 'en')
-
-        # Verify HMAC
-        if not hmac_key or not received_hmac or not verify_hmac(hmac_key, payload, received_hmac):
-            return jsonify({
-                "data": None,
-                "status": 401,
-                "message": "غير مصرح به" if language == 'ar' else "Unauthorized"
-            }), 401
-
-        telecom_data = {
-            "complainProviders": [
-                {"code": "20", "value": "Oman Telecommunications Company (Omantel)"},
-                {"code": "21", "value": "Omani Qatari Telecommunications Company (Ooredoo)"}
-            ],
-            "serviceTypes": [
-                {
-                    "code": "TF", 
-                    "value": "Telecom Fixed",
-                    "subType": [
-                        {"code": "1", "value": "ADSL"},
-                        {"code": "2", "value": "5G"}
-                    ]
-                }
-            ],
-            "customerTypes": [
-                {"code": "C", "value": "Corporate"},
-                {"code": "I", "value": "Individual"}
-            ],
-            "complainTypes": [
-                {"code": "1", "value": "Billing & payment", "locationRequired": False},
-                {"code": "2", "value": "Quality of service", "locationRequired": True}
-            ]
-        }
-        
-        return jsonify({
-            "data": telecom_data,
-            "status": 200,
-            "message": ""
-        }), 200
+        return catalogs.response('complaintFields', language(), request)
     
     except Exception as e:
-        logger.error(f"Error in get_complaint_fields: {e}")
-        return jsonify({
-            "data": None,
-            "status": 500,
-            "message": str(e)
-        }), 500
+        logger.error("Error in get_complaint_fields: %s", e)
+        return respond(None, 500, str(e))
 
 @app.route('/cmt/chatbot/getLocationDetails', methods=['GET'])
 def get_location_details():
     """Get location details"""
     try:
-        location_data = {
-            "governorates": ["Muscat", "Dhofar"],
-            "wilayas": [
-                {"code": "30", "desc": "Muscat", "villages": ["Seeb", "Bawshar"]},
-                {"code": "31", "desc": "Al Batinah", "villages": ["Sohar", "Rustaq"]}
-            ]
-        }
-        
-        return jsonify({
-            "data": location_data,
-            "status": 200,
-            "message": ""
-        }), 200
+        return catalogs.response('locationDetails', language(), request)
+    
+    except Exception as e:
+        logger.error("Error in get_location_details: %s", e)
+        return respond(None, 500, str(e))
+
+MAX_PAGE_SIZE = 200
+
+def page_args():
+    """Read 1-based page and size query parameters"""
+    page = int(request.args.get('page', 1))
+    size = int(request.args.get('size', 50))
+    if page < 1 or not 1 <= size <= MAX_PAGE_SIZE:
+        raise ValueError("Invalid page")
+    return page, size
+
+def location_page(indexes, page, size):
+    items = paginate(indexes, page, size)
+    lang = language()
+    return respond({
+        "items": [locations.node(i, lang) for i in items],
+        "page": page,
+        "size": size,
+        "total": len(indexes)
+    })
+
+@app.route('/cmt/chatbot/getLocationChildren', methods=['GET'])
+def get_location_children():
+    """List the children of a location code, or the governorates without one"""
+    try:
+        code = request.args.get('code')
+        try:
+            page, size = page_args()
+        except ValueError:
+            return message('invalid_parameters')
+
+        if code is not None and code not in locations.by_code:
+            return message('location_not_found')
+
+        return location_page(locations.children(code), page, size)
+    
+    except Exception as e:
+        logger.error("Error in get_location_children: %s", e)
+        return respond(None, 500, str(e))
+
+@app.route('/cmt/chatbot/listLocations', methods=['GET'])
+def list_locations():
+    """Paginated listing of every location at one level"""
+    try:
+        level = request.args.get('level', 'governorate')
+        try:
+            page, size = page_args()
+        except ValueError:
+            return message('invalid_parameters')
+        if level not in LEVELS:
+            return message('invalid_parameters')
+
+        return location_page(locations.level_range(level), page, size)
+    
+    except Exception as e:
+        logger.error("Error in list_locations: %s", e)
+        return respond(None, 500, str(e))
+
+@app.route('/cmt/chatbot/searchLocations', methods=['GET'])
+def search_locations():
+    """Autocomplete locations by English or Arabic name prefix"""
+    try:
+        prefix = request.args.get('q', '')
+        level = request.args.get('level')
+        try:
+            limit = int(request.args.get('limit', 10))
+        except ValueError:
+            return message('invalid_parameters')
+        if not prefix.strip() or (level and level not in LEVELS) or not 1 <= limit <= 20:
+            return message('invalid_parameters')
+
+        lang = language()
+        return respond([locations.node(i, lang) for i in locations.search(prefix, level, limit)])
     
     except Exception as e:
-        logger.error(f"Error in get_location_details: {e}")
-        return jsonify({
-            "data": None,
-            "status": 500,
-            "message": str(e)
-        }), 500
+        logger.error("Error in search_locations: %s", e)
+        return respond(None, 500, str(e))
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=10000, debug=True)
@@ -0,0 +1,363 @@
+"""Replay-driven load benchmark for the CMT endpoints.
+
+Replays the request sequences in bench_scenarios.json from concurrent
+virtual users, signing chatbot requests with the JWT and HMAC key each
+user gets from loginWithOTP. Runs in-process through the Flask test
+client or against gunicorn started locally with several worker/thread
+configurations, and reports throughput and p50/p95/p99 per endpoint as
+JSON.
+
+    python benchmark.py --mode inprocess --users 8 --iterations 50
+    python benchmark.py --mode gunicorn --configs 1x1,2x4,4x8 --output bench.json
+    python benchmark.py --mode inprocess --compare bench.json
+    python benchmark.py --mode boot
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import http.client
+import json
+import math
+import os
+import secrets
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def bench_env(workdir):
+    """Environment isolating the app's state files and relaxing OTP limits"""
+    return {
+        'COMPLAINT_DB': os.path.join(workdir, 'complaints.db'),
+        'OTP_DB': os.path.join(workdir, 'otp.db'),
+        'METRICS_DIR': os.path.join(workdir, 'metrics'),
+        'JWT_SECRET_KEY': secrets.token_hex(32),
+        'HMAC_SECRET_KEY': secrets.token_hex(32),
+        'LOG_HASH_KEY': secrets.token_hex(32),
+        'OTP_MODE': 'static',
+        'OTP_SEND_LIMIT': '1000000',
+        'OTP_VERIFY_LIMIT': '1000000',
+        'LOG_LEVEL': 'WARNING',
+    }
+
+
+class InProcessClient:
+    """Sends requests through the Flask test client"""
+
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def request(self, method, path, body, headers):
+        response = self._client.open(path, method=method, data=body, headers=headers)
+        return response.status_code, response.get_data()
+
+
+class HttpClient:
+    """Sends requests over one keep-alive HTTP connection"""
+
+    def __init__(self, port):
+        self._port = port
+        self._conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+
+    def request(self, method, path, body, headers):
+        try:
+            self._conn.request(method, path, body=body, headers=headers)
+            response = self._conn.getresponse()
+            return response.status, response.read()
+        except (OSError, http.client.HTTPException):
+            # A failed exchange leaves the connection unusable; start over
+            self._conn.close()
+            self._conn = http.client.HTTPConnection('127.0.0.1', self._port, timeout=30)
+            raise
+
+
+def _fill(value, phone):
+    if isinstance(value, str):
+        return value.replace('{phone}', phone)
+    if isinstance(value, dict):
+        return {k: _fill(v, phone) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_fill(v, phone) for v in value]
+    return value
+
+
+def replay(client, scenario, phone, record):
+    """Run one scenario as one user, calling record(step, seconds, ok).
+
+    seconds is None for steps that were skipped because login failed.
+    """
+    session = {}
+    for step in scenario['steps']:
+        headers = {'Accept-Language': 'en'}
+        body = None
+        if 'body' in step:
+            body = json.dumps(_fill(step['body'], phone)).encode()
+            headers['Content-Type'] = 'application/json'
+        if step.get('signed'):
+            if not session:
+                record(step['name'], None, False)
+                continue
+            headers['Authorization'] = f"Bearer {session['token']}"
+            mac = hmac.new(session['key'].encode(), body or b'', hashlib.sha256).digest()
+            headers['Hmac'] = base64.b64encode(mac).decode()
+
+        start = time.perf_counter()
+        try:
+            status, data = client.request(step['method'], _fill(step['path'], phone), body, headers)
+        except (OSError, http.client.HTTPException):
+            status, data = 0, b''
+        record(step['name'], time.perf_counter() - start, status == 200)
+
+        if step.get('login') and status == 200:
+            session = json.loads(data)['data']
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = math.ceil(q / 100 * len(sorted_values))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+
+def run_load(make_client, scenarios, users, iterations):
+    """Replay every scenario iterations times from each user thread"""
+    samples, errors = {}, {}
+    lock = threading.Lock()
+
+    def record(name, seconds, ok):
+        # Only successful requests count towards latency; a failure is often
+        # faster than real work and would make a broken build look quick
+        with lock:
+            values = samples.setdefault(name, [])
+            if ok:
+                values.append(seconds)
+            else:
+                errors[name] = errors.get(name, 0) + 1
+
+    def user(number):
+        client = make_client()
+        for iteration in range(iterations):
+            for scenario in scenarios:
+                phone = f"9{number:03d}{iteration % 10000:04d}"
+                replay(client, scenario, phone, record)
+
+    threads = [threading.Thread(target=user, args=(n,)) for n in range(users)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    def ms(values, q):
+        value = percentile(values, q)
+        return round(value * 1000, 3) if value is not None else None
+
+    endpoints = {}
+    for name, values in sorted(samples.items()):
+        values.sort()
+        endpoints[name] = {
+            'count': len(values),
+            'errors': errors.get(name, 0),
+            'throughput_rps': round(len(values) / elapsed, 2),
+            'p50_ms': ms(values, 50),
+            'p95_ms': ms(values, 95),
+            'p99_ms': ms(values, 99),
+        }
+    total = sum(e['count'] for e in endpoints.values())
+    return {
+        'elapsed_s': round(elapsed, 3),
+        'requests': total,
+        'errors': sum(e['errors'] for e in endpoints.values()),
+        'throughput_rps': round(total / elapsed, 2),
+        'endpoints': endpoints,
+    }
+
+
+def run_inprocess(scenarios, users, iterations):
+    workdir = tempfile.mkdtemp(prefix='tra_bench_')
+    env = bench_env(workdir)
+    saved = {name: os.environ.get(name) for name in env}
+    os.environ.update(env)
+    try:
+        sys.path.insert(0, HERE)
+        import app as app_module
+        try:
+            return {'inprocess': run_load(lambda: InProcessClient(app_module.app), scenarios, users, iterations)}
+        finally:
+            app_module.complaints.close()
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_until_up(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {process.returncode}")
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("gunicorn did not start in time")
+
+
+def run_gunicorn(scenarios, users, iterations, configs, worker_class):
+    results = {}
+    for config in configs:
+        workers, threads = (int(n) for n in config.split('x'))
+        workdir = tempfile.mkdtemp(prefix='tra_bench_')
+        port = _free_port()
+        env = {**os.environ, **bench_env(workdir)}
+        # The config picks the worker class from the environment so gevent
+        # can patch before the app is preloaded; -k would come too late
+        env['GUNICORN_WORKER_CLASS'] = 'sync' if worker_class == 'gthread' and threads == 1 else worker_class
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app',
+             '--bind', f'127.0.0.1:{port}',
+             '--workers', str(workers),
+             '--threads', str(threads)],
+            cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            _wait_until_up(port, process)
+            results[f'gunicorn-{config}'] = run_load(lambda: HttpClient(port), scenarios, users, iterations)
+        finally:
+            process.terminate()
+            process.wait(30)
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def run_boot(repeat, workers):
+    """Time a cold import of the app and a gunicorn start to its first response"""
+    imports, starts = [], []
+    for _ in range(repeat):
+        workdir = tempfile.mkdtemp(prefix='tra_bench_')
+        env = {**os.environ, **bench_env(workdir)}
+        try:
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', 'import app'], cwd=HERE, env=env, check=True)
+            imports.append(time.perf_counter() - start)
+
+            port = _free_port()
+            start = time.perf_counter()
+            process = subprocess.Popen(
+                [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app',
+                 '--bind', f'127.0.0.1:{port}', '--workers', str(workers)],
+                cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            try:
+                _wait_until_up(port, process)
+                starts.append(time.perf_counter() - start)
+            finally:
+                process.terminate()
+                process.wait(30)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    imports.sort()
+    starts.sort()
+    return {'boot': {
+        'repeat': repeat,
+        'workers': workers,
+        'import_p50_ms': round(percentile(imports, 50) * 1000, 1),
+        'import_max_ms': round(imports[-1] * 1000, 1),
+        'first_response_p50_ms': round(percentile(starts, 50) * 1000, 1),
+        'first_response_max_ms': round(starts[-1] * 1000, 1),
+    }}
+
+
+def compare(current, baseline, threshold):
+    """List regressions of current against baseline beyond threshold"""
+    regressions = []
+    for run, result in current['runs'].items():
+        base_run = baseline.get('runs', {}).get(run)
+        if not base_run or 'endpoints' not in result:
+            continue
+        for name, stats in result['endpoints'].items():
+            base = base_run['endpoints'].get(name)
+            if not base:
+                continue
+            for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+                if base[metric] and stats[metric] is not None and stats[metric] > base[metric] * (1 + threshold):
+                    regressions.append(f"{run} {name} {metric}: {base[metric]} -> {stats[metric]}")
+            if stats['throughput_rps'] < base['throughput_rps'] * (1 - threshold):
+                regressions.append(
+                    f"{run} {name} throughput_rps: {base['throughput_rps']} -> {stats['throughput_rps']}"
+                )
+            if stats['errors'] > base['errors']:
+                regressions.append(f"{run} {name} errors: {base['errors']} -> {stats['errors']}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--mode', choices=('inprocess', 'gunicorn', 'boot', 'all'), default='inprocess')
+    parser.add_argument('--scenarios', default=os.path.join(HERE, 'bench_scenarios.json'))
+    parser.add_argument('--users', type=int, default=8, help="concurrent virtual users")
+    parser.add_argument('--iterations', type=int, default=20, help="scenario replays per user")
+    parser.add_argument('--configs', default='1x1,2x4,4x8', help="gunicorn WORKERSxTHREADS list")
+    parser.add_argument('--worker-class', default='gthread')
+    parser.add_argument('--boot-repeat', type=int, default=5, help="cold starts timed in boot mode")
+    parser.add_argument('--output', help="write results JSON here instead of stdout")
+    parser.add_argument('--compare', metavar='BASELINE', help="flag regressions against a stored result")
+    parser.add_argument('--threshold', type=float, default=0.10, help="allowed relative slowdown")
+    args = parser.parse_args(argv)
+
+    with open(args.scenarios) as f:
+        scenarios = json.load(f)
+
+    runs = {}
+    if args.mode in ('inprocess', 'all'):
+        runs.update(run_inprocess(scenarios, args.users, args.iterations))
+    if args.mode in ('gunicorn', 'all'):
+        runs.update(run_gunicorn(
+            scenarios, args.users, args.iterations, args.configs.split(','), args.worker_class
+        ))
+    if args.mode in ('boot', 'all'):
+        runs.update(run_boot(args.boot_repeat, workers=2))
+
+    result = {
+        'users': args.users,
+        'iterations': args.iterations,
+        'python': sys.version.split()[0],
+        'cpus': os.cpu_count(),
+        'runs': runs,
+    }
+    if args.compare:
+        with open(args.compare) as f:
+            result['regressions'] = compare(result, json.load(f), args.threshold)
+
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return 1 if result.get('regressions') else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
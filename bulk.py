@@ -0,0 +1,147 @@
+"""Incremental parsing of bulk complaint uploads.
+
+Uploads are either NDJSON (one complaint per line) or a single JSON
+array. Both are read a chunk at a time so only the current item is held
+in memory.
+"""
+import codecs
+import itertools
+import json
+import re
+
+READ_SIZE = 64 * 1024
+# Array items still unparsed, and NDJSON lines, past this many characters
+# are rejected
+MAX_ITEM_SIZE = 1024 * 1024
+_TRUNCATED_TAIL = len('-Infinity')
+_NUMBER_CHARS = re.compile(r'[0-9.eE+-]*')
+
+_decoder = json.JSONDecoder()
+
+
+class UploadError(ValueError):
+    """An item that could not be decoded"""
+
+
+def _text_chunks(upload):
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    while True:
+        chunk = upload.read(READ_SIZE)
+        if not chunk:
+            tail = decoder.decode(b'', final=True)
+            if tail:
+                yield tail
+            return
+        yield decoder.decode(chunk)
+
+
+def _iter_lines(buffer, chunks):
+    """Yield each line, or one UploadError for a line over MAX_ITEM_SIZE"""
+    parts, size, oversized = [], 0, False
+    for chunk in itertools.chain((buffer,), chunks):
+        *complete, rest = chunk.split('\n')
+        for piece in complete:
+            if not oversized:
+                if size + len(piece) > MAX_ITEM_SIZE:
+                    yield _too_large()
+                else:
+                    yield ''.join(parts) + piece
+            parts, size, oversized = [], 0, False
+        if not oversized:
+            parts.append(rest)
+            size += len(rest)
+            if size > MAX_ITEM_SIZE:
+                # Report it now and skip the rest of the line as it arrives
+                yield _too_large()
+                parts, size, oversized = [], 0, True
+    if not oversized:
+        yield ''.join(parts)
+
+
+def _iter_ndjson(first, chunks):
+    for line in _iter_lines(first, chunks):
+        if isinstance(line, UploadError):
+            yield line
+        elif line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield UploadError(f"Invalid JSON: {e}")
+
+
+def _too_large():
+    return UploadError(f"Item is larger than {MAX_ITEM_SIZE} characters")
+
+
+def _is_number(item):
+    return isinstance(item, (int, float)) and not isinstance(item, bool)
+
+
+def _truncated(error, buffer):
+    """Whether a decode error could just be the buffer ending mid-item"""
+    if error.msg.startswith('Unterminated string'):
+        return True
+    # Cut-off literals and escapes fail where they start, at most
+    # len('-Infinity') characters from the end
+    return len(buffer) - error.pos < _TRUNCATED_TAIL
+
+
+def _iter_array(buffer, chunks):
+    pos = buffer.index('[') + 1
+    expect_item = True
+    after_comma = False
+    while True:
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+            pos += 1
+        if pos == len(buffer):
+            chunk = next(chunks, None)
+            if chunk is None:
+                yield UploadError("Unterminated JSON array")
+                return
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        if buffer[pos] == ']':
+            if after_comma:
+                yield UploadError("Trailing comma in JSON array")
+            return
+        if not expect_item:
+            if buffer[pos] != ',':
+                yield UploadError(f"Expected ',' or ']' but found {buffer[pos]!r}")
+                return
+            pos += 1
+            expect_item = after_comma = True
+            continue
+        try:
+            item, end = _decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            chunk = next(chunks, None) if _truncated(e, buffer) else None
+            if chunk is None:
+                yield UploadError(f"Invalid JSON: {e}")
+                return
+            if len(buffer) - pos > MAX_ITEM_SIZE:
+                yield _too_large()
+                return
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        if _is_number(item) and _NUMBER_CHARS.match(buffer, end).end() == len(buffer):
+            # The number may carry on in the next chunk, so decode it again
+            chunk = next(chunks, None)
+            if chunk is not None:
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
+        yield item
+        pos = end
+        expect_item = after_comma = False
+
+
+def iter_items(upload):
+    """Yield each decoded item of an upload, or an UploadError in its place"""
+    chunks = _text_chunks(upload)
+    buffer = ''
+    for chunk in chunks:
+        buffer += chunk
+        if buffer.strip():
+            break
+    if buffer.lstrip().startswith('['):
+        return _iter_array(buffer, chunks)
+    return _iter_ndjson(buffer, chunks)
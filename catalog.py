@@ -0,0 +1,151 @@
+"""Pre-serialized, ETag-aware responses for the chatbot catalog endpoints"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+
+from flask import Response
+
+from responses import LANGUAGES, serialize
+
+logger = logging.getLogger(__name__)
+
+# How often (seconds) CATALOG_FILE is checked for changes, and how long
+# clients may reuse a catalog before revalidating it
+CHECK_INTERVAL = float(os.environ.get('CATALOG_CHECK_INTERVAL', '5'))
+MAX_AGE = int(os.environ.get('CATALOG_MAX_AGE', '300'))
+
+# Built-in catalogs, keyed by catalog name and then language. Languages
+# without their own entry fall back to English.
+DEFAULT_CATALOGS = {
+    "complaintFields": {
+        "en": {
+            "complainProviders": [
+                {"code": "20", "value": "Oman Telecommunications Company (Omantel)"},
+                {"code": "21", "value": "Omani Qatari Telecommunications Company (Ooredoo)"}
+            ],
+            "serviceTypes": [
+                {
+                    "code": "TF",
+                    "value": "Telecom Fixed",
+                    "subType": [
+                        {"code": "1", "value": "ADSL"},
+                        {"code": "2", "value": "5G"}
+                    ]
+                }
+            ],
+            "customerTypes": [
+                {"code": "C", "value": "Corporate"},
+                {"code": "I", "value": "Individual"}
+            ],
+            "complainTypes": [
+                {"code": "1", "value": "Billing & payment", "locationRequired": False},
+                {"code": "2", "value": "Quality of service", "locationRequired": True}
+            ]
+        }
+    }
+}
+
+
+class CatalogEntry:
+    """One serialized catalog with its compressed variants and ETag"""
+    __slots__ = ('identity', 'gzip', 'deflate', 'etag')
+
+    def __init__(self, data):
+        self.identity = serialize({"data": data, "status": 200, "message": ""})
+        self.gzip = gzip.compress(self.identity, mtime=0)
+        self.deflate = zlib.compress(self.identity, 9)
+        self.etag = hashlib.sha256(self.identity).hexdigest()[:32]
+
+    def variant(self, accept_encodings):
+        """Pick the smallest representation the client accepts"""
+        body, encoding = self.identity, None
+        if accept_encodings['gzip'] and len(self.gzip) < len(body):
+            body, encoding = self.gzip, 'gzip'
+        if accept_encodings['deflate'] and len(self.deflate) < len(body):
+            body, encoding = self.deflate, 'deflate'
+        return body, encoding
+
+    def etag_for(self, encoding):
+        """Strong ETag for one representation of this catalog"""
+        return f"{self.etag}-{encoding}" if encoding else self.etag
+
+
+class CatalogCache:
+    """Serializes every catalog once per language and serves the bytes.
+
+    Catalogs come from DEFAULT_CATALOGS, or from a JSON file with the same
+    shape when a path is given. The file is re-read when its mtime changes,
+    so each gunicorn worker picks up edits without a restart. Catalogs in
+    extra are built elsewhere and take precedence over the file.
+    """
+
+    def __init__(self, path=None, extra=None):
+        self.path = path
+        self.extra = extra or {}
+        self._entries = {}
+        self._mtime = None
+        self._checked = time.monotonic()
+        self._lock = threading.Lock()
+        self.reload()
+
+    def _read_source(self):
+        if not self.path:
+            return DEFAULT_CATALOGS, None
+        mtime = os.stat(self.path).st_mtime_ns
+        with open(self.path, encoding='utf-8') as f:
+            return json.load(f), mtime
+
+    def reload(self):
+        """Rebuild every catalog entry and swap them in atomically"""
+        catalogs, mtime = self._read_source()
+        catalogs = {**catalogs, **self.extra}
+        entries = {}
+        for name, by_language in catalogs.items():
+            for language in LANGUAGES:
+                data = by_language.get(language, by_language['en'])
+                entries[(name, language)] = CatalogEntry(data)
+        self._entries = entries
+        self._mtime = mtime
+        logger.info("Loaded %d catalogs from %s", len(catalogs), self.path or 'defaults')
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked < CHECK_INTERVAL or not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._checked = now
+            if os.stat(self.path).st_mtime_ns != self._mtime:
+                self.reload()
+        except (OSError, ValueError, KeyError) as e:
+            logger.error("Catalog reload failed, keeping previous data: %s", e)
+        finally:
+            self._lock.release()
+
+    def get(self, name, language):
+        """Return the CatalogEntry for a catalog name and language"""
+        if self.path:
+            self._maybe_reload()
+        return self._entries[(name, language if language in LANGUAGES else 'en')]
+
+    def response(self, name, language, request):
+        """Build the response for a catalog, honouring If-None-Match"""
+        entry = self.get(name, language)
+        body, encoding = entry.variant(request.accept_encodings)
+        etag = entry.etag_for(encoding)
+
+        if request.if_none_match.contains_weak(etag) or request.if_none_match.contains_weak(entry.etag):
+            response = Response(status=304)
+        else:
+            response = Response(body, status=200, mimetype='application/json')
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = f"private, max-age={MAX_AGE}"
+        response.headers['Vary'] = 'Accept-Encoding, Accept-Language'
+        return response
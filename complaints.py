@@ -0,0 +1,203 @@
+"""Durable complaint store backed by SQLite in WAL mode.
+
+Complaints from every request thread are handed to a single background
+writer that commits them in batches (group commit), so a burst of
+requests shares one fsync instead of paying one each.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.environ.get('COMPLAINT_DB', 'complaints.db')
+# Longest time (seconds) the writer waits to fill a batch, and its size cap
+FLUSH_INTERVAL = float(os.environ.get('COMPLAINT_FLUSH_INTERVAL', '0.002'))
+BATCH_SIZE = int(os.environ.get('COMPLAINT_BATCH_SIZE', '256'))
+# How long a request waits for its batch to be committed
+COMMIT_TIMEOUT = float(os.environ.get('COMPLAINT_COMMIT_TIMEOUT', '5'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS complaints (
+    id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    phone TEXT,
+    provider TEXT,
+    service_type TEXT,
+    customer_type TEXT,
+    complaint_type TEXT,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_complaints_created ON complaints (created_at);
+CREATE INDEX IF NOT EXISTS idx_complaints_phone ON complaints (phone, created_at);
+CREATE INDEX IF NOT EXISTS idx_complaints_provider ON complaints (provider, created_at);
+CREATE INDEX IF NOT EXISTS idx_complaints_type ON complaints (complaint_type, created_at);
+"""
+
+INSERT = "INSERT INTO complaints VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+
+# Query filter name -> indexed column
+FILTERS = {
+    'phone': 'phone',
+    'complainProvider': 'provider',
+    'complainType': 'complaint_type',
+}
+
+
+class _Pending:
+    """A complaint waiting for the writer to commit it"""
+    __slots__ = ('complaint_id', 'row', 'done', 'error')
+
+    def __init__(self, complaint_id, row):
+        self.complaint_id = complaint_id
+        self.row = row
+        self.done = threading.Event()
+        self.error = None
+
+    def wait(self):
+        """Block until committed and return the complaint ID"""
+        if not self.done.wait(COMMIT_TIMEOUT):
+            raise TimeoutError("Complaint was not committed in time")
+        if self.error:
+            raise self.error
+        return self.complaint_id
+
+
+class ComplaintStore:
+    """Append-only complaint table with a group-commit background writer"""
+
+    def __init__(self, path=DB_PATH, flush_interval=FLUSH_INTERVAL, batch_size=BATCH_SIZE):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writer = None
+        self._pid = None
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+        atexit.register(self.close)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=FULL')
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _ensure_writer(self):
+        # Threads do not survive fork, so each gunicorn worker starts its own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._local = threading.local()
+                self._writer = threading.Thread(target=self._run, name='complaint-writer', daemon=True)
+                self._writer.start()
+                self._pid = os.getpid()
+
+    def _run(self):
+        conn = self._connect()
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit(conn, batch)
+        conn.close()
+
+    def _commit(self, conn, batch):
+        try:
+            with conn:
+                conn.executemany(INSERT, [pending.row for pending in batch])
+        except sqlite3.Error as e:
+            if len(batch) > 1:
+                # Retry row by row so one bad complaint does not fail the rest
+                logger.warning("Complaint batch of %d failed, retrying rows singly: %s", len(batch), e)
+                for pending in batch:
+                    self._commit(conn, [pending])
+                return
+            logger.error("Complaint %s failed: %s", batch[0].complaint_id, e)
+            batch[0].error = e
+        for pending in batch:
+            pending.done.set()
+
+    def submit(self, data, phone=None):
+        """Queue a complaint for the next batch without waiting for it"""
+        self._ensure_writer()
+        complaint_id = uuid.uuid4().hex
+        pending = _Pending(complaint_id, (
+            complaint_id,
+            time.time(),
+            phone or data.get('phone'),
+            data.get('complainProvider'),
+            data.get('serviceType'),
+            data.get('customerType'),
+            data.get('complainType'),
+            json.dumps(data, ensure_ascii=False),
+        ))
+        self._queue.put(pending)
+        return pending
+
+    def add(self, data, phone=None):
+        """Persist a complaint and return its ID once it is committed"""
+        return self.submit(data, phone).wait()
+
+    def search(self, since=None, until=None, limit=100, **filters):
+        """Return complaints matching the given filters, newest first"""
+        clauses, params = [], []
+        for name, value in filters.items():
+            if value is not None:
+                clauses.append(f"{FILTERS[name]} = ?")
+                params.append(str(value))
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(float(since))
+        if until is not None:
+            clauses.append("created_at < ?")
+            params.append(float(until))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        params.append(int(limit))
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        rows = conn.execute(
+            f"SELECT id, created_at, payload FROM complaints {where} ORDER BY created_at DESC LIMIT ?",
+            params
+        ).fetchall()
+        return [
+            {"complainId": row['id'], "createdAt": row['created_at'], **json.loads(row['payload'])}
+            for row in rows
+        ]
+
+    def close(self):
+        """Flush queued complaints and stop the writer"""
+        if self._writer is not None and self._pid == os.getpid() and self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(COMMIT_TIMEOUT)
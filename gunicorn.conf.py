@@ -0,0 +1,71 @@
+"""Production gunicorn settings.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The app is imported once in the master (preload_app), so catalogs, the
+location index and the secrets are built before fork and shared
+copy-on-write by every worker. Each worker then only has to start its
+own background threads. Tune with:
+
+    GUNICORN_WORKER_CLASS  gthread (default) or gevent; do not use -k, which
+                           is applied too late to monkey-patch the app
+    WEB_CONCURRENCY        worker processes (default: CPU count, or 2*CPU+1 for sync)
+    GUNICORN_THREADS       threads per gthread worker (default 4)
+"""
+import gc
+import multiprocessing
+import os
+import shutil
+import time
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+
+if worker_class == 'gevent':
+    # Patch before the app is preloaded so its locks and threads are cooperative
+    try:
+        from gevent import monkey
+    except ImportError:
+        raise RuntimeError("GUNICORN_WORKER_CLASS=gevent needs the gevent package (pip install gevent)")
+    monkey.patch_all()
+
+cpus = multiprocessing.cpu_count()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '10000')}"
+preload_app = True
+workers = int(os.environ.get('WEB_CONCURRENCY', cpus if worker_class != 'sync' else cpus * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4 if worker_class == 'gthread' else 1))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+keepalive = 5
+timeout = 30
+graceful_timeout = 30
+
+
+def on_starting(server):
+    if 'gevent' in server.cfg.worker_class_str and worker_class != 'gevent':
+        # -k only takes effect after the app was preloaded unpatched
+        raise RuntimeError("Select gevent with GUNICORN_WORKER_CLASS=gevent, not -k/--worker-class")
+    # Metrics files from a previous run would be summed into this one
+    import metrics
+    shutil.rmtree(metrics.METRICS_DIR, ignore_errors=True)
+
+
+def when_ready(server):
+    # Everything allocated so far is long-lived; keeping it out of the
+    # collector's reach stops gc from touching (and copying) shared pages
+    gc.freeze()
+
+
+def pre_fork(server, worker):
+    worker.fork_started = time.perf_counter()
+
+
+def post_fork(server, worker):
+    import logs
+    logs.pipeline.start()
+
+
+def post_worker_init(worker):
+    import metrics
+    boot = time.perf_counter() - worker.fork_started
+    metrics.observe_phase('worker_boot', boot)
+    worker.log.info("Worker %s booted in %.1f ms", worker.pid, boot * 1000)
@@ -0,0 +1,247 @@
+"""Indexed governorate/wilaya/village hierarchy.
+
+Nodes are numbered breadth-first, so every level and every node's
+children occupy a contiguous index range and are kept in flat arrays.
+Names in English and Arabic are indexed in a radix tree whose nodes
+carry their best matches, so autocomplete costs O(prefix length).
+"""
+import json
+import logging
+import unicodedata
+from array import array
+
+logger = logging.getLogger(__name__)
+
+LEVELS = ('governorate', 'wilaya', 'village')
+MAX_SUGGESTIONS = 20
+
+# Built-in sample with the same names and wilaya codes as the original
+# getLocationDetails payload. That payload never said which governorate a
+# wilaya belongs to, so the governorate codes and parent links here are
+# placeholders (Al Batinah is not really in Dhofar). Set LOCATION_FILE to
+# a JSON list in the same shape to load the real dataset. Codes are
+# optional on villages.
+DEFAULT_LOCATIONS = [
+    {"code": "01", "en": "Muscat", "ar": "مسقط", "children": [
+        {"code": "30", "en": "Muscat", "ar": "مسقط", "children": [
+            {"en": "Seeb", "ar": "السيب"},
+            {"en": "Bawshar", "ar": "بوشر"}
+        ]}
+    ]},
+    {"code": "02", "en": "Dhofar", "ar": "ظفار", "children": [
+        {"code": "31", "en": "Al Batinah", "ar": "الباطنة", "children": [
+            {"en": "Sohar", "ar": "صحار"},
+            {"en": "Rustaq", "ar": "الرستاق"}
+        ]}
+    ]}
+]
+
+# Letter variants folded together after accents and Arabic diacritics
+# (including hamza and madda on alef) are stripped; tatweel is dropped
+_ARABIC_FOLD = str.maketrans({'\u0629': '\u0647', '\u0649': '\u064a', '\u0640': None})
+
+
+def normalize(text):
+    """Fold case, accents, Arabic diacritics and letter variants for matching"""
+    text = unicodedata.normalize('NFKD', text.casefold())
+    text = ''.join(c for c in text if not unicodedata.combining(c)).translate(_ARABIC_FOLD)
+    return ' '.join(text.split())
+
+
+class _RadixNode:
+    """Path-compressed trie node.
+
+    edges maps an edge's first character to (label, child). matches holds
+    node indexes below this point in ascending order, which is also level
+    order, with at most MAX_SUGGESTIONS per level.
+    """
+    __slots__ = ('edges', 'matches')
+
+    def __init__(self, matches=()):
+        self.edges = None
+        self.matches = list(matches)
+
+    def add_match(self, index, depth, levels):
+        matches = self.matches
+        if matches and matches[-1] == index:
+            return
+        same_level = 0
+        for i in reversed(matches):
+            if levels[i] != depth:
+                break
+            same_level += 1
+        if same_level < MAX_SUGGESTIONS:
+            matches.append(index)
+
+
+def _common_prefix(a, b):
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+class LocationIndex:
+    """Read-only location tree with code lookup, children and prefix search"""
+
+    def __init__(self, tree):
+        # Breadth-first numbering keeps siblings and levels contiguous
+        self.codes = []
+        self.names = {'en': [], 'ar': []}
+        self.level = array('b')
+        self.parent = array('i')
+        self.first_child = array('i')
+        self.child_count = array('i')
+        self.level_start = array('i', [0] * (len(LEVELS) + 1))
+
+        queue = [(node, -1, 0) for node in tree]
+        head = 0
+        while head < len(queue):
+            node, parent, depth = queue[head]
+            index = head
+            head += 1
+            code = node.get('code')
+            if code is None and depth + 1 < len(LEVELS):
+                raise ValueError(f"Location {node['en']} has no code")
+            self.codes.append(str(code) if code is not None else None)
+            self.names['en'].append(node['en'])
+            self.names['ar'].append(node.get('ar') or node['en'])
+            self.level.append(depth)
+            self.parent.append(parent)
+            children = node.get('children') or []
+            if children and depth + 1 >= len(LEVELS):
+                raise ValueError(f"Location {node['code']} is nested deeper than {LEVELS[-1]}")
+            self.first_child.append(len(queue))
+            self.child_count.append(len(children))
+            queue.extend((child, index, depth + 1) for child in children)
+
+        for depth in range(len(LEVELS) + 1):
+            self.level_start[depth] = next(
+                (i for i, d in enumerate(self.level) if d >= depth), len(self.codes)
+            )
+        self.by_code = {code: index for index, code in enumerate(self.codes) if code is not None}
+        self._trie = self._build_trie()
+
+    def _build_trie(self):
+        root = _RadixNode()
+        for index in range(len(self.codes)):
+            keys = set()
+            for name in (self.names['en'][index], self.names['ar'][index]):
+                words = normalize(name).split()
+                # Match from the start of the name and of every later word
+                keys.update(' '.join(words[i:]) for i in range(len(words)))
+            for key in keys:
+                self._insert(root, key, index)
+        self._freeze(root)
+        return root
+
+    def _insert(self, node, key, index):
+        depth = self.level[index]
+        pos = 0
+        while pos < len(key):
+            if node.edges is None:
+                node.edges = {}
+            edge = node.edges.get(key[pos])
+            if edge is None:
+                child = _RadixNode()
+                node.edges[key[pos]] = (key[pos:], child)
+                child.add_match(index, depth, self.level)
+                return
+            label, child = edge
+            common = _common_prefix(label, key[pos:])
+            if common < len(label):
+                # Split the edge; the new middle node covers everything below child
+                middle = _RadixNode(child.matches)
+                middle.edges = {label[common]: (label[common:], child)}
+                node.edges[key[pos]] = (label[:common], middle)
+                child = middle
+            child.add_match(index, depth, self.level)
+            node = child
+            pos += common
+
+    def _freeze(self, root):
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            node.matches = tuple(node.matches)
+            if node.edges:
+                stack.extend(child for _, child in node.edges.values())
+
+    @classmethod
+    def load(cls, path=None):
+        """Build the index from a JSON file, or from DEFAULT_LOCATIONS"""
+        if not path:
+            return cls(DEFAULT_LOCATIONS)
+        with open(path, encoding='utf-8') as f:
+            index = cls(json.load(f))
+        logger.info("Loaded %d locations from %s", len(index.codes), path)
+        return index
+
+    def node(self, index, language):
+        """Public representation of one node"""
+        parent = self.parent[index]
+        return {
+            "code": self.codes[index],
+            "desc": self.names[language if language == 'ar' else 'en'][index],
+            "level": LEVELS[self.level[index]],
+            "parentCode": self.codes[parent] if parent >= 0 else None,
+            "childCount": self.child_count[index]
+        }
+
+    def details(self):
+        """Full governorate and wilaya listing served by getLocationDetails.
+
+        Always in English, as the original endpoint was.
+        """
+        names = self.names['en']
+        return {
+            "governorates": [names[i] for i in self.level_range('governorate')],
+            "wilayas": [
+                {
+                    "code": self.codes[i],
+                    "desc": names[i],
+                    "villages": [names[v] for v in self.children(self.codes[i])]
+                }
+                for i in self.level_range('wilaya')
+            ]
+        }
+
+    def children(self, code):
+        """Index range of a node's children, or of the governorates for None"""
+        if code is None:
+            return range(self.level_start[0], self.level_start[1])
+        index = self.by_code[code]
+        start = self.first_child[index]
+        return range(start, start + self.child_count[index])
+
+    def level_range(self, level):
+        """Index range of every node at a level"""
+        depth = LEVELS.index(level)
+        return range(self.level_start[depth], self.level_start[depth + 1])
+
+    def search(self, prefix, level=None, limit=10):
+        """Indexes of nodes whose English or Arabic name starts with prefix"""
+        prefix = normalize(prefix)
+        node, pos = self._trie, 0
+        while pos < len(prefix):
+            edge = node.edges.get(prefix[pos]) if node.edges else None
+            if edge is None:
+                return []
+            label, child = edge
+            rest = prefix[pos:]
+            if not (label.startswith(rest) or rest.startswith(label)):
+                return []
+            node = child
+            pos += len(label)
+        # Matches are in index order: governorates, then wilayas, then villages
+        if level:
+            depth = LEVELS.index(level)
+            return [i for i in node.matches if self.level[i] == depth][:limit]
+        return list(node.matches[:limit])
+
+
+def paginate(indexes, page, size):
+    """Slice an index range for 1-based page numbers"""
+    start = (page - 1) * size
+    return indexes[start:start + size]
@@ -0,0 +1,245 @@
+"""Non-blocking JSON logging.
+
+Request threads only attach request context to a record and put it on a
+bounded queue; a QueueListener thread does the formatting, redaction and
+batched writes. When the queue is full records are dropped and counted
+instead of blocking the request.
+"""
+import atexit
+import copy
+import functools
+import hashlib
+import hmac
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import secrets
+import sys
+import time
+import uuid
+
+from flask import g, has_request_context, request
+
+import metrics
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+BATCH_SIZE = int(os.environ.get('LOG_BATCH_SIZE', 256))
+# Key for phone_hash; set it so hashes match across workers and restarts
+LOG_HASH_KEY = os.environ.get('LOG_HASH_KEY')
+if not LOG_HASH_KEY:
+    logging.getLogger(__name__).warning(
+        "LOG_HASH_KEY is not set; using a random key, phone hashes will differ between workers"
+    )
+    LOG_HASH_KEY = secrets.token_hex(32)
+LOG_HASH_KEY = LOG_HASH_KEY.encode()
+# Fraction of requests per route whose INFO/DEBUG records are kept, e.g.
+# "/cmt/chatbot/getLocationDetails=0.1,/cmt/chatbot/getComplaintFields=0.1"
+SAMPLE_RATES = dict(
+    (route, float(rate))
+    for route, _, rate in (
+        item.partition('=') for item in os.environ.get('LOG_SAMPLE_RATES', '').split(',') if item
+    )
+)
+
+# Standalone digit runs (phone numbers, OTPs) in free-text messages
+_DIGITS = re.compile(r'\+?\b\d{4,15}\b')
+_REDACTED_FIELDS = {'otp', 'code', 'token', 'key'}
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+_exc_formatter = logging.Formatter()
+
+access_logger = logging.getLogger('access')
+
+
+@functools.lru_cache(maxsize=4096)
+def hash_phone(phone):
+    """Identifier for a phone number, keyed so it cannot be brute-forced"""
+    return hmac.new(LOG_HASH_KEY, str(phone).encode(), hashlib.sha256).hexdigest()[:16]
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when full.
+
+    Drops are exported as tra_log_records_dropped_total at /metrics.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Merge args and render the traceback now, so the queued record holds
+        # only strings and no longer references request objects; the JSON
+        # formatting still happens on the listener thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _exc_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            metrics.inc('tra_log_records_dropped_total', {})
+
+
+class RequestContextFilter(logging.Filter):
+    """Attach request context and apply per-route sampling"""
+
+    def filter(self, record):
+        if not has_request_context():
+            return True
+        if record.levelno < logging.WARNING and not g.get('log_sampled', True):
+            return False
+        record.request_id = g.get('request_id')
+        record.route = request.url_rule.rule if request.url_rule else request.path
+        record.method = request.method
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with phones hashed and secrets redacted"""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 6),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': _DIGITS.sub('[redacted]', record.getMessage()),
+        }
+        for name, value in vars(record).items():
+            if name in _RECORD_FIELDS:
+                continue
+            if name == 'phone':
+                if value:
+                    entry['phone_hash'] = hash_phone(value)
+            elif name in _REDACTED_FIELDS:
+                entry[name] = '[redacted]'
+            else:
+                entry[name] = value
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        elif record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class BatchingStreamHandler(logging.Handler):
+    """Buffer formatted lines and write them in one call per batch.
+
+    A batch is written when it is full or when the listener has drained
+    the queue, so lines are never held back while the app is idle.
+    """
+
+    def __init__(self, log_queue, stream=None, batch_size=BATCH_SIZE):
+        super().__init__()
+        self.queue = log_queue
+        self.stream = stream or sys.stderr
+        self.batch_size = batch_size
+        self._lines = []
+
+    def emit(self, record):
+        try:
+            self._lines.append(self.format(record))
+        except Exception:
+            self.handleError(record)
+        if len(self._lines) >= self.batch_size or self.queue.empty():
+            self.flush()
+
+    def flush(self):
+        if self._lines:
+            self.stream.write('\n'.join(self._lines) + '\n')
+            self.stream.flush()
+            self._lines = []
+
+
+class LogPipeline:
+    """Owns the queue, root handler and listener thread"""
+
+    def __init__(self):
+        self.queue = queue.Queue(QUEUE_SIZE)
+        self.handler = DroppingQueueHandler(self.queue)
+        self.handler.addFilter(RequestContextFilter())
+        self.output = BatchingStreamHandler(self.queue)
+        self.output.setFormatter(JsonFormatter())
+        self._listener = None
+        self._pid = None
+
+    def start(self):
+        """Start the listener thread in this process if it is not running"""
+        if self._pid == os.getpid():
+            return
+        if self._pid is not None:
+            # Forked from a process that owned the listener: its queue and
+            # locks may be mid-use, so start over with a fresh queue
+            self.queue = self.handler.queue = self.output.queue = queue.Queue(QUEUE_SIZE)
+        self._listener = logging.handlers.QueueListener(self.queue, self.output)
+        self._listener.start()
+        self._pid = os.getpid()
+
+    def stop(self):
+        """Drain the queue and stop the listener"""
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+            self.output.flush()
+            self._pid = None
+
+
+pipeline = LogPipeline()
+atexit.register(pipeline.stop)
+
+
+def setup(app):
+    """Route all logging through the pipeline and log one line per request"""
+    root = logging.getLogger()
+    root.handlers[:] = [pipeline.handler]
+    root.setLevel(LOG_LEVEL)
+    pipeline.start()
+
+    @app.before_request
+    def _start_request_log():
+        # Threads do not survive fork, so each worker starts its own listener
+        pipeline.start()
+        g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+        g.request_start = time.perf_counter()
+        rule = request.url_rule.rule if request.url_rule else request.path
+        rate = SAMPLE_RATES.get(rule, 1.0)
+        g.log_sampled = rate >= 1.0 or random.random() < rate
+
+    @app.after_request
+    def _finish_request_log(response):
+        start = g.get('request_start', 0)
+        extra = {
+            'status': response.status_code,
+            'phone': g.session['phone'] if 'session' in g else None,
+        }
+        response.headers['X-Request-ID'] = g.get('request_id', '')
+
+        if not response.is_streamed:
+            extra['duration_ms'] = round((time.perf_counter() - start) * 1000, 3)
+            access_logger.info("request", extra=extra)
+            return response
+
+        # Streamed bodies are generated after this hook, so log once the
+        # response is closed; the request context may be gone by then
+        if g.get('log_sampled', True):
+            extra.update(
+                request_id=g.get('request_id'),
+                route=request.url_rule.rule if request.url_rule else request.path,
+                method=request.method,
+            )
+
+            def log_streamed():
+                extra['duration_ms'] = round((time.perf_counter() - start) * 1000, 3)
+                access_logger.info("request", extra=extra)
+
+            response.call_on_close(log_streamed)
+        return response
@@ -0,0 +1,293 @@
+"""Request and phase latency metrics shared across gunicorn workers.
+
+Every thread writes its own memory-mapped file under METRICS_DIR, so
+recording a value is a dict lookup and an in-place float update with no
+locks. /metrics reads all files in the directory and sums them, which
+aggregates every worker on the host. Clear METRICS_DIR when the server
+starts so values from a previous run are not included.
+"""
+import bisect
+import functools
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from flask import Response, g, request
+from flask.json.provider import DefaultJSONProvider
+
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'tra_metrics'))
+# Requests slower than this many milliseconds get their cProfile dumped
+# to PROFILE_DIR; profiling is off when unset
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 0))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'tra_profiles'))
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, float('inf'))
+
+_INITIAL_SIZE = 64 * 1024
+_HEADER = struct.Struct('i')
+_VALUE = struct.Struct('d')
+
+
+class _ShardFile:
+    """Append-only key -> float table in a memory-mapped file.
+
+    Only the owning thread writes; readers may run in any process. Each
+    entry is a length-prefixed key padded to 8 bytes followed by a double,
+    and the header holds the number of bytes in use.
+    """
+
+    def __init__(self, path):
+        self._f = open(path, 'a+b')
+        if os.fstat(self._f.fileno()).st_size == 0:
+            self._f.truncate(_INITIAL_SIZE)
+        self._m = mmap.mmap(self._f.fileno(), 0)
+        self._positions = {}
+        used = _HEADER.unpack_from(self._m, 0)[0]
+        if used == 0:
+            used = 8
+            _HEADER.pack_into(self._m, 0, used)
+        for key, _, pos in _read_entries(self._m, used):
+            self._positions[key] = pos
+        self._used = used
+
+    def _add_key(self, key):
+        encoded = key.encode()
+        padding = 8 - (_HEADER.size + len(encoded)) % 8
+        entry = _HEADER.pack(len(encoded)) + encoded + b' ' * padding + _VALUE.pack(0.0)
+        while self._used + len(entry) > len(self._m):
+            size = len(self._m) * 2
+            self._m.close()
+            self._f.truncate(size)
+            self._m = mmap.mmap(self._f.fileno(), 0)
+        self._m[self._used:self._used + len(entry)] = entry
+        self._used += len(entry)
+        # Publish the entry only once it is fully written
+        _HEADER.pack_into(self._m, 0, self._used)
+        pos = self._used - _VALUE.size
+        self._positions[key] = pos
+        return pos
+
+    def inc(self, key, amount):
+        pos = self._positions.get(key)
+        if pos is None:
+            pos = self._add_key(key)
+        _VALUE.pack_into(self._m, pos, _VALUE.unpack_from(self._m, pos)[0] + amount)
+
+
+def _read_entries(data, used):
+    pos = 8
+    while pos < used:
+        length = _HEADER.unpack_from(data, pos)[0]
+        pos += _HEADER.size
+        key = bytes(data[pos:pos + length]).decode()
+        pos += length + 8 - (_HEADER.size + length) % 8
+        yield key, _VALUE.unpack_from(data, pos)[0], pos
+        pos += _VALUE.size
+
+
+# Shards belong to OS threads. Under gevent, threading.local and
+# get_ident are per greenlet, which would mean a new file per connection.
+_monkey = sys.modules.get('gevent.monkey')
+if _monkey is not None and _monkey.is_module_patched('threading'):
+    _get_ident = _monkey.get_original('_thread', 'get_ident')
+else:
+    _get_ident = threading.get_ident
+
+_shards = {}
+_shards_pid = None
+_shards_lock = threading.Lock()
+
+
+def _shard():
+    global _shards, _shards_pid
+    pid = os.getpid()
+    shard = _shards.get(_get_ident()) if _shards_pid == pid else None
+    if shard is None:
+        with _shards_lock:
+            if _shards_pid != pid:
+                _shards, _shards_pid = {}, pid
+            ident = _get_ident()
+            shard = _shards.get(ident)
+            if shard is None:
+                os.makedirs(METRICS_DIR, exist_ok=True)
+                path = os.path.join(METRICS_DIR, f"{pid}-{ident}.bin")
+                shard = _shards[ident] = _ShardFile(path)
+    return shard
+
+
+@functools.lru_cache(maxsize=4096)
+def _key(name, labels):
+    return json.dumps([name, dict(labels)])
+
+
+def inc(name, labels, amount=1.0):
+    """Add to a counter"""
+    _shard().inc(_key(name, tuple(labels.items())), amount)
+
+
+def observe(name, labels, seconds):
+    """Record one histogram observation"""
+    shard = _shard()
+    items = tuple(labels.items())
+    bucket = BUCKETS[bisect.bisect_left(BUCKETS, seconds)]
+    shard.inc(_key(f"{name}_bucket", items + (('le', bucket),)), 1.0)
+    shard.inc(_key(f"{name}_sum", items), seconds)
+    shard.inc(_key(f"{name}_count", items), 1.0)
+
+
+def observe_phase(phase, seconds):
+    """Record time spent in one internal phase of request handling"""
+    observe('tra_phase_duration_seconds', {'phase': phase}, seconds)
+
+
+def timed(phase):
+    """Decorator that records a function's run time as a phase"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe_phase(phase, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that records parse and serialization phases"""
+
+    def loads(self, s, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().loads(s, **kwargs)
+        finally:
+            observe_phase('json_parse', time.perf_counter() - start)
+
+    def dumps(self, obj, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            observe_phase('serialization', time.perf_counter() - start)
+
+
+def collect():
+    """Sum every shard file in METRICS_DIR"""
+    totals = defaultdict(float)
+    try:
+        names = os.listdir(METRICS_DIR)
+    except FileNotFoundError:
+        return totals
+    for name in names:
+        if not name.endswith('.bin'):
+            continue
+        try:
+            with open(os.path.join(METRICS_DIR, name), 'rb') as f:
+                data = f.read()
+        except OSError:
+            continue
+        if len(data) < 8:
+            continue
+        for key, value, _ in _read_entries(data, _HEADER.unpack_from(data, 0)[0]):
+            totals[key] += value
+    return totals
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        f'{k}="{"+Inf" if v == float("inf") else v}"' for k, v in labels.items()
+    )
+    return '{' + pairs + '}'
+
+
+def render():
+    """Render all metrics in the Prometheus text format"""
+    totals = collect()
+    series = defaultdict(list)
+    for key, value in totals.items():
+        name, labels = json.loads(key)
+        series[name].append((labels, value))
+
+    lines = []
+    for name in sorted(series):
+        base = name.rsplit('_', 1)[0] if name.endswith(('_bucket', '_sum', '_count')) else name
+        if name == base:
+            lines.append(f"# TYPE {name} counter")
+        elif name.endswith('_bucket'):
+            lines.append(f"# TYPE {base} histogram")
+            # Buckets are stored per interval; Prometheus expects them cumulative
+            groups = defaultdict(dict)
+            for labels, value in series[name]:
+                le = labels.pop('le')
+                groups[json.dumps(labels, sort_keys=True)][le] = value
+            for group, counts in groups.items():
+                labels, running = json.loads(group), 0.0
+                for le in BUCKETS:
+                    running += counts.get(le, 0.0)
+                    lines.append(f"{name}{_format_labels({**labels, 'le': le})} {running:g}")
+            continue
+        for labels, value in sorted(series[name], key=lambda item: json.dumps(item[0], sort_keys=True)):
+            lines.append(f"{name}{_format_labels(labels)} {value:g}")
+    return '\n'.join(lines) + '\n'
+
+
+def setup(app):
+    """Record per-route metrics, expose /metrics and profile slow requests"""
+    app.json = TimedJSONProvider(app)
+
+    @app.before_request
+    def _start_metrics():
+        g.metrics_start = time.perf_counter()
+        if SLOW_REQUEST_MS:
+            # Imported here so the profiler costs nothing at boot when unused
+            import cProfile
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                g.profiler = profiler
+            except ValueError:
+                # Another thread is already being profiled
+                pass
+
+    def _finish(route, method, status, start, profiler):
+        elapsed = time.perf_counter() - start
+        inc('tra_http_requests_total', {'route': route, 'method': method, 'status': status})
+        observe('tra_http_request_duration_seconds', {'route': route}, elapsed)
+
+        if profiler is not None:
+            profiler.disable()
+            if elapsed * 1000 >= SLOW_REQUEST_MS:
+                os.makedirs(PROFILE_DIR, exist_ok=True)
+                filename = f"{route.strip('/').replace('/', '_') or 'root'}-{int(time.time())}-{uuid.uuid4().hex[:8]}.prof"
+                profiler.dump_stats(os.path.join(PROFILE_DIR, filename))
+
+    @app.after_request
+    def _record_metrics(response):
+        args = (
+            request.url_rule.rule if request.url_rule else 'unmatched',
+            request.method,
+            response.status_code,
+            g.get('metrics_start', time.perf_counter()),
+            g.pop('profiler', None),
+        )
+        if response.is_streamed:
+            # The body is generated after this hook; time it once it has been sent
+            response.call_on_close(lambda: _finish(*args))
+        else:
+            _finish(*args)
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """Prometheus metrics for every worker on this host"""
+        return Response(render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,166 @@
+"""OTP codes and sliding-window rate limits shared by all workers on a host.
+
+State lives in a local SQLite database so every gunicorn worker sees the
+same codes and counters without an external service. Expired rows are
+skipped on read and removed by a periodic indexed sweep rather than on
+every request.
+"""
+import contextlib
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+DB_PATH = os.environ.get('OTP_DB', 'otp.db')
+# 'static' accepts STATIC_OTP for every phone (testing), 'random' issues
+# a fresh single-use code per send
+OTP_MODE = os.environ.get('OTP_MODE', 'static')
+STATIC_OTP = os.environ.get('STATIC_OTP', '123456')
+OTP_TTL = int(os.environ.get('OTP_TTL', 300))
+OTP_MAX_ATTEMPTS = int(os.environ.get('OTP_MAX_ATTEMPTS', 5))
+SEND_LIMIT = int(os.environ.get('OTP_SEND_LIMIT', 5))
+SEND_WINDOW = int(os.environ.get('OTP_SEND_WINDOW', 900))
+VERIFY_LIMIT = int(os.environ.get('OTP_VERIFY_LIMIT', 10))
+VERIFY_WINDOW = int(os.environ.get('OTP_VERIFY_WINDOW', 900))
+SWEEP_INTERVAL = int(os.environ.get('OTP_SWEEP_INTERVAL', 60))
+# Development sink: issued codes are appended here as JSON lines. A real
+# deployment replaces deliver() with its SMS sender.
+SINK_FILE = os.environ.get('OTP_SINK_FILE')
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS otp_codes (
+    phone TEXT PRIMARY KEY,
+    code_hash TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_otp_codes_expires ON otp_codes (expires_at);
+CREATE TABLE IF NOT EXISTS rate_events (
+    key TEXT NOT NULL,
+    at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_rate_events_key ON rate_events (key, at);
+CREATE INDEX IF NOT EXISTS idx_rate_events_at ON rate_events (at);
+"""
+
+
+class RateLimited(Exception):
+    """Raised when a phone has used up its sliding-window allowance"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Retry after {retry_after} seconds")
+        self.retry_after = retry_after
+
+
+def _hash_code(phone, code):
+    return hashlib.sha256(f"{phone}:{code}".encode()).hexdigest()
+
+
+def deliver(phone, code):
+    """Send an issued code to the user; returns False if there is nowhere to send it"""
+    if not SINK_FILE:
+        return False
+    line = json.dumps({"phone": phone, "code": code, "ts": time.time()}) + "\n"
+    with open(SINK_FILE, 'a', encoding='utf-8') as f:
+        f.write(line)
+    return True
+
+
+class OtpStore:
+    """Per-phone OTP codes with TTL and send/verify rate limits"""
+
+    def __init__(self, path=DB_PATH, mode=OTP_MODE):
+        self.path = path
+        self.mode = mode
+        self._local = threading.local()
+        self._next_sweep = 0.0
+        self._connection().executescript(SCHEMA)
+        if mode == 'random' and not SINK_FILE:
+            logger.warning("OTP_MODE=random but OTP_SINK_FILE is not set; issued codes are not delivered")
+
+    def _connection(self):
+        # Connections are per thread and are not reused across fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # IMMEDIATE takes the write lock up front, so check-then-insert is
+        # atomic across workers
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _hit(self, conn, key, limit, window, now):
+        """Record one event for key, or raise RateLimited if the window is full"""
+        count, oldest = conn.execute(
+            "SELECT COUNT(*), MIN(at) FROM rate_events WHERE key = ? AND at > ?",
+            (key, now - window)
+        ).fetchone()
+        if count >= limit:
+            raise RateLimited(max(1, int(oldest + window - now) + 1))
+        conn.execute("INSERT INTO rate_events VALUES (?, ?)", (key, now))
+
+    def _maybe_sweep(self, conn, now):
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + SWEEP_INTERVAL
+        conn.execute("DELETE FROM otp_codes WHERE expires_at <= ?", (now,))
+        conn.execute(
+            "DELETE FROM rate_events WHERE at <= ?",
+            (now - max(SEND_WINDOW, VERIFY_WINDOW),)
+        )
+
+    def issue(self, phone):
+        """Create and store a code for phone, returning it"""
+        now = time.time()
+        code = STATIC_OTP if self.mode == 'static' else f"{secrets.randbelow(10 ** 6):06d}"
+        with self._transaction() as conn:
+            self._hit(conn, f"send:{phone}", SEND_LIMIT, SEND_WINDOW, now)
+            self._maybe_sweep(conn, now)
+            conn.execute(
+                "INSERT OR REPLACE INTO otp_codes VALUES (?, ?, ?, 0)",
+                (phone, _hash_code(phone, code), now + OTP_TTL)
+            )
+        return code
+
+    def verify(self, phone, code):
+        """Check a code for phone; a correct code can only be used once"""
+        now = time.time()
+        with self._transaction() as conn:
+            self._hit(conn, f"verify:{phone}", VERIFY_LIMIT, VERIFY_WINDOW, now)
+            self._maybe_sweep(conn, now)
+            if self.mode == 'static':
+                return hmac.compare_digest(str(code).encode(), STATIC_OTP.encode())
+
+            row = conn.execute(
+                "SELECT code_hash, attempts FROM otp_codes WHERE phone = ? AND expires_at > ?",
+                (phone, now)
+            ).fetchone()
+            if row is None:
+                return False
+            if hmac.compare_digest(row[0], _hash_code(phone, code)):
+                conn.execute("DELETE FROM otp_codes WHERE phone = ?", (phone,))
+                return True
+            if row[1] + 1 >= OTP_MAX_ATTEMPTS:
+                conn.execute("DELETE FROM otp_codes WHERE phone = ?", (phone,))
+            else:
+                conn.execute("UPDATE otp_codes SET attempts = attempts + 1 WHERE phone = ?", (phone,))
+            return False
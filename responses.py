@@ -0,0 +1,87 @@
+"""Response envelopes and bilingual messages shared by every route.
+
+Every route answers with {"data", "status", "message"}. Messages are
+looked up by key in MESSAGES; envelopes without data are serialized once
+at import, so most error and status replies are a prebuilt byte string.
+"""
+import functools
+import json
+import time
+
+from flask import Response, request
+
+import metrics
+
+LANGUAGES = ('en', 'ar')
+DEFAULT_LANGUAGE = 'en'
+
+# key -> (status, English, Arabic)
+MESSAGES = {
+    'invalid_phone': (400, "Invalid phone number", "رقم الهاتف غير صالح"),
+    'otp_sent': (200, "OTP sent successfully", "تم إرسال رمز التحقق"),
+    'incomplete': (400, "Incomplete information", "معلومات غير كاملة"),
+    'invalid_otp': (401, "Invalid OTP", "رمز التحقق غير صحيح"),
+    'user_verified': (200, "User verified", "تم التحقق من المستخدم"),
+    'too_many_attempts': (429, "Too many attempts, please try again later", "محاولات كثيرة، يرجى المحاولة لاحقا"),
+    'unauthorized': (401, "Unauthorized", "غير مصرح به"),
+    'payload_too_large': (413, "Payload too large", "حجم الطلب كبير جدا"),
+    'complaint_received': (200, "Thank you, your complaint will be processed", "شكرا ، سيتم النظر في الطلب المقدم"),
+    'invalid_search': (400, "Invalid search parameters", "معلومات غير صالحة"),
+    'invalid_parameters': (400, "Invalid parameters", "معلومات غير صالحة"),
+    'location_not_found': (404, "Location not found", "الموقع غير موجود"),
+}
+
+
+def serialize(envelope):
+    """Serialize an envelope exactly as jsonify does outside debug mode"""
+    return (json.dumps(envelope, sort_keys=True, separators=(',', ':')) + "\n").encode()
+
+
+# (key, language) -> (status, text, body of the envelope with no data)
+_COMPILED = {
+    (key, language): (status, text, serialize({"data": None, "status": status, "message": text}))
+    for key, (status, *texts) in MESSAGES.items()
+    for language, text in zip(LANGUAGES, texts)
+}
+
+
+@functools.lru_cache(maxsize=512)
+def parse_accept_language(header):
+    """Pick the supported language with the highest q-value in a header"""
+    best, best_q = DEFAULT_LANGUAGE, 0.0
+    for item in header.split(','):
+        tag, _, params = item.strip().partition(';')
+        primary = tag.strip().split('-')[0].lower()
+        if primary not in LANGUAGES:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                continue
+        if q > best_q:
+            best, best_q = primary, q
+    return best
+
+
+def language():
+    """Language for the current request"""
+    return parse_accept_language(request.headers.get('Accept-Language', ''))
+
+
+def respond(data=None, status=200, message=""):
+    """Serialize an envelope into a JSON response"""
+    start = time.perf_counter()
+    body = serialize({"data": data, "status": status, "message": message})
+    metrics.observe_phase('serialization', time.perf_counter() - start)
+    return Response(body, status=status, mimetype='application/json')
+
+
+def message(key, data=None):
+    """Response for a MESSAGES entry in the request's language"""
+    status, text, body = _COMPILED[(key, language())]
+    if data is not None:
+        return respond(data, status, text)
+    return Response(body, status=status, mimetype='application/json')
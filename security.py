@@ -0,0 +1,254 @@
+"""Session tokens and request signing checks shared by the chatbot routes"""
+import base64
+import collections
+import functools
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import tempfile
+import threading
+import time
+
+import jwt
+from flask import g, request
+
+import metrics
+from responses import message
+
+logger = logging.getLogger(__name__)
+
+
+def _load_secret(name):
+    """Read a secret from the environment, or make a per-process one"""
+    value = os.environ.get(name)
+    if not value:
+        logger.warning("%s is not set; using a random key, tokens will not work across workers", name)
+        value = secrets.token_hex(32)
+    return value
+
+
+JWT_SECRET_KEY = _load_secret('JWT_SECRET_KEY')
+HMAC_SECRET_KEY = _load_secret('HMAC_SECRET_KEY')
+TOKEN_TTL = int(os.environ.get('TOKEN_TTL', 3600))
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 10000))
+# Phones whose sessions may read complaints filed under other phones
+OPERATOR_PHONES = frozenset(p.strip() for p in os.environ.get('OPERATOR_PHONES', '').split(',') if p.strip())
+
+# 'raw' signs the request body bytes, 'legacy' signs str() of the parsed
+# JSON, 'both' accepts either while clients migrate
+HMAC_MODE = os.environ.get('HMAC_MODE', 'raw')
+MAX_BODY_SIZE = int(os.environ.get('HMAC_MAX_BODY_SIZE', 1024 * 1024))
+# Uploads are spooled to disk past SPOOL_SIZE bytes while they are hashed
+MAX_UPLOAD_SIZE = int(os.environ.get('HMAC_MAX_UPLOAD_SIZE', 256 * 1024 * 1024))
+SPOOL_SIZE = 1024 * 1024
+READ_CHUNK_SIZE = 64 * 1024
+
+
+@functools.lru_cache(maxsize=1024)
+def _keyed_hmac(hmac_key):
+    """HMAC object with the key schedule done once; callers must .copy() it"""
+    return hmac.new(hmac_key.encode(), digestmod=hashlib.sha256)
+
+
+@metrics.timed('generate_jwt_token')
+def generate_jwt_token(phone, issued_at):
+    """Generate a JWT token for the user"""
+    payload = {
+        'phone': phone,
+        'exp': issued_at + TOKEN_TTL,
+        'iat': issued_at
+    }
+    return jwt.encode(payload, JWT_SECRET_KEY, algorithm='HS256')
+
+
+@metrics.timed('generate_hmac_key')
+def generate_hmac_key(phone, issued_at):
+    """Derive the session HMAC key from the token's phone and iat claims.
+
+    Any worker holding HMAC_SECRET_KEY can recompute it, so no session
+    state has to be shared.
+    """
+    message = f"{phone}:{issued_at}"
+    hmac_digest = hmac.new(
+        HMAC_SECRET_KEY.encode(),
+        message.encode(),
+        hashlib.sha256
+    ).digest()
+    return base64.b64encode(hmac_digest).decode()
+
+
+def is_operator(session):
+    """Whether a session belongs to an operator listed in OPERATOR_PHONES"""
+    return session['phone'] in OPERATOR_PHONES
+
+
+class TokenCache:
+    """Bounded LRU of decoded JWT claims; entries are dropped at their exp"""
+
+    def __init__(self, maxsize=TOKEN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._claims = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def decode(self, token):
+        """Return the claims for a token, raising jwt.InvalidTokenError if invalid"""
+        now = time.time()
+        with self._lock:
+            claims = self._claims.get(token)
+            if claims is not None:
+                if claims['exp'] > now:
+                    self._claims.move_to_end(token)
+                    return claims
+                del self._claims[token]
+
+        claims = jwt.decode(
+            token, JWT_SECRET_KEY, algorithms=['HS256'],
+            options={'require': ['exp', 'iat', 'phone']}
+        )
+        with self._lock:
+            self._claims[token] = claims
+            if len(self._claims) > self.maxsize:
+                self._claims.popitem(last=False)
+        return claims
+
+
+tokens = TokenCache()
+
+
+def _matches(mac, received_hmac):
+    # Compare bytes: compare_digest raises on non-ASCII str, and header
+    # values arrive as latin-1 decoded str
+    return hmac.compare_digest(base64.b64encode(mac.digest()), received_hmac.encode('latin-1'))
+
+
+def verify_hmac(hmac_key, payload, received_hmac):
+    """Verify the HMAC for a given payload"""
+    try:
+        mac = _keyed_hmac(hmac_key).copy()
+        mac.update(payload.encode() if isinstance(payload, str) else payload)
+        return _matches(mac, received_hmac)
+    except Exception as e:
+        logger.error("HMAC verification error: %s", e)
+        return False
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+def _read_signed_body(hmac_key, write, max_size=MAX_BODY_SIZE):
+    """Read the request body in chunks, feeding each one to the HMAC and write"""
+    mac = _keyed_hmac(hmac_key).copy()
+    size = 0
+    while True:
+        chunk = request.stream.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_size:
+            raise BodyTooLarge()
+        mac.update(chunk)
+        write(chunk)
+    return mac
+
+
+def require_hmac(view):
+    """Reject requests whose Hmac header does not sign the body.
+
+    In 'raw' mode the signature is checked before any JSON decoding. Under
+    require_session the key is the one bound to the session.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        hmac_key = g.get('hmac_key') or request.headers.get('Hmac-Key')
+        received_hmac = request.headers.get('Hmac')
+
+        if not hmac_key or not received_hmac:
+            return message('unauthorized')
+        if request.content_length is not None and request.content_length > MAX_BODY_SIZE:
+            return message('payload_too_large')
+
+        start = time.perf_counter()
+        verified = False
+        if HMAC_MODE in ('raw', 'both'):
+            chunks = []
+            try:
+                verified = _matches(_read_signed_body(hmac_key, chunks.append), received_hmac)
+            except BodyTooLarge:
+                return message('payload_too_large')
+            # Leave the bytes on the request so get_json() does not re-read the stream
+            request._cached_data = b''.join(chunks)
+        if not verified and HMAC_MODE in ('legacy', 'both'):
+            data = request.get_json(silent=True)
+            verified = verify_hmac(hmac_key, str(data), received_hmac)
+        metrics.observe_phase('verify_hmac', time.perf_counter() - start)
+
+        if not verified:
+            return message('unauthorized')
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def require_session(view):
+    """Reject requests without a valid Bearer token we issued.
+
+    The session's HMAC key is derived from the token claims and stored on
+    flask.g for require_hmac; a client-sent Hmac-Key must match it.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() != 'bearer' or not token:
+            return message('unauthorized')
+
+        try:
+            claims = tokens.decode(token)
+        except jwt.InvalidTokenError:
+            return message('unauthorized')
+
+        hmac_key = generate_hmac_key(claims['phone'], claims['iat'])
+        sent_key = request.headers.get('Hmac-Key')
+        if sent_key is not None and not hmac.compare_digest(sent_key.encode('latin-1'), hmac_key.encode()):
+            return message('unauthorized')
+
+        g.session = claims
+        g.hmac_key = hmac_key
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def require_signed_upload(view):
+    """Like require_hmac, for bodies too large to hold in memory.
+
+    The body is always signed raw. It is spooled to a temporary file while
+    it is hashed, and the view receives it as flask.g.upload only once the
+    signature has been verified.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        hmac_key = g.get('hmac_key') or request.headers.get('Hmac-Key')
+        received_hmac = request.headers.get('Hmac')
+
+        if not hmac_key or not received_hmac:
+            return message('unauthorized')
+        if request.content_length is not None and request.content_length > MAX_UPLOAD_SIZE:
+            return message('payload_too_large')
+
+        start = time.perf_counter()
+        upload = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        try:
+            mac = _read_signed_body(hmac_key, upload.write, MAX_UPLOAD_SIZE)
+        except BodyTooLarge:
+            upload.close()
+            return message('payload_too_large')
+        metrics.observe_phase('verify_hmac', time.perf_counter() - start)
+
+        if not _matches(mac, received_hmac):
+            upload.close()
+            return message('unauthorized')
+        upload.seek(0)
+        g.upload = upload
+        return view(*args, **kwargs)
+    return wrapper
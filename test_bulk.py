@@ -0,0 +1,116 @@
+import io
+import json
+
+import pytest
+
+import bulk
+from bulk import UploadError, iter_items
+
+
+class ChunkedUpload:
+    """File-like upload that returns at most size bytes per read"""
+
+    def __init__(self, data, size):
+        self._f = io.BytesIO(data)
+        self._size = size
+
+    def read(self, n=-1):
+        return self._f.read(min(n, self._size) if n >= 0 else self._size)
+
+
+def decode(data, chunk_size=3):
+    return [str(item) if isinstance(item, UploadError) else item
+            for item in iter_items(ChunkedUpload(data.encode(), chunk_size))]
+
+
+ITEMS = [
+    {"complainType": "1", "description": "ساعات \\ \"quoted\" é"},
+    12345,
+    -1.5e10,
+    True,
+    None,
+    "a long string value",
+    [1, [2, 3], {"a": {}}],
+]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 64, 1 << 16])
+def test_array_items_split_at_every_boundary(chunk_size):
+    data = json.dumps(ITEMS, ensure_ascii=False)
+    assert decode(data, chunk_size) == ITEMS
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 64])
+def test_ndjson_items_split_at_every_boundary(chunk_size):
+    data = '\n'.join(json.dumps(item, ensure_ascii=False) for item in ITEMS) + '\n'
+    assert decode(data, chunk_size) == ITEMS
+
+
+def test_number_split_across_chunks():
+    assert decode('[1,12,123]', chunk_size=2) == [1, 12, 123]
+
+
+def test_empty_array():
+    assert decode('  [ ] ') == []
+
+
+def test_trailing_comma_is_rejected():
+    assert decode('[{"a": 1},]') == [{"a": 1}, "Trailing comma in JSON array"]
+
+
+def test_unterminated_array():
+    assert decode('[1, 2') == [1, 2, "Unterminated JSON array"]
+
+
+def test_missing_comma():
+    assert decode('[1 2]') == [1, "Expected ',' or ']' but found '2'"]
+
+
+def test_ndjson_bad_line_is_skipped():
+    items = decode('{"a": 1}\nnot json\n{"b": 2}\n')
+    assert items[0] == {"a": 1}
+    assert items[1].startswith("Invalid JSON")
+    assert items[2] == {"b": 2}
+
+
+def test_malformed_item_is_reported_without_reading_the_rest():
+    upload = ChunkedUpload(('[{"a": x}' + ', {"b": 2}' * 10000 + ']').encode(), 16)
+    items = list(iter_items(upload))
+    assert len(items) == 1 and str(items[0]).startswith("Invalid JSON")
+    assert upload._f.tell() <= 64
+
+
+def test_oversized_item_is_rejected(monkeypatch):
+    monkeypatch.setattr(bulk, 'MAX_ITEM_SIZE', 100)
+    upload = ChunkedUpload(('[{"a": "' + 'x' * 10000 + '"}]').encode(), 16)
+    items = list(iter_items(upload))
+    assert [str(i) for i in items] == ["Item is larger than 100 characters"]
+    assert upload._f.tell() < 200
+
+
+def test_ndjson_oversized_line_is_skipped(monkeypatch):
+    monkeypatch.setattr(bulk, 'MAX_ITEM_SIZE', 100)
+    data = '{"a": 1}\n{"b": "' + 'x' * 1000 + '"}\n{"c": 3}\n' + '{"d": 4}'
+    assert decode(data, chunk_size=16) == [
+        {"a": 1}, "Item is larger than 100 characters", {"c": 3}, {"d": 4}
+    ]
+
+
+def test_ndjson_line_just_over_limit_in_one_chunk(monkeypatch):
+    monkeypatch.setattr(bulk, 'MAX_ITEM_SIZE', 10)
+    assert decode('{"a": [1, 2, 3]}\n{"a": 1}\n', chunk_size=64) == [
+        "Item is larger than 10 characters", {"a": 1}
+    ]
+
+
+def test_ndjson_long_line_is_not_buffered():
+    tracemalloc = pytest.importorskip('tracemalloc')
+    data = ('{"a": "' + 'x' * (16 * 1024 * 1024) + '"}\n{"b": 2}\n').encode()
+    tracemalloc.start()
+    try:
+        items = [str(i) if isinstance(i, UploadError) else i for i in iter_items(io.BytesIO(data))]
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert items == [f"Item is larger than {bulk.MAX_ITEM_SIZE} characters", {"b": 2}]
+    assert peak < 8 * 1024 * 1024
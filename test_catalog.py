@@ -0,0 +1,104 @@
+import gzip
+import json
+import os
+import zlib
+
+import pytest
+from flask import Flask, request
+
+import catalog
+from catalog import DEFAULT_CATALOGS, CatalogCache
+
+
+def make_client(cache):
+    app = Flask(__name__)
+
+    @app.route('/<name>')
+    def serve(name):
+        return cache.response(name, request.headers.get('Accept-Language', 'en'), request)
+
+    return app.test_client()
+
+
+@pytest.fixture
+def client():
+    return make_client(CatalogCache())
+
+
+def test_serves_the_envelope(client):
+    response = client.get('/complaintFields')
+    assert response.status_code == 200
+    assert response.get_json() == {"data": DEFAULT_CATALOGS['complaintFields']['en'], "status": 200, "message": ""}
+    assert response.headers['Cache-Control'] == f"private, max-age={catalog.MAX_AGE}"
+    assert response.headers['Vary'] == 'Accept-Encoding, Accept-Language'
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_if_none_match_gives_304(client):
+    etag = client.get('/complaintFields').headers['ETag']
+    response = client.get('/complaintFields', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.get_data() == b''
+    assert response.headers['ETag'] == etag
+
+    assert client.get('/complaintFields', headers={'If-None-Match': '"other"'}).status_code == 200
+
+
+@pytest.mark.parametrize('encoding, decompress', [('gzip', gzip.decompress), ('deflate', zlib.decompress)])
+def test_compressed_variants_have_their_own_etag(client, encoding, decompress):
+    plain = client.get('/complaintFields')
+    response = client.get('/complaintFields', headers={'Accept-Encoding': encoding})
+    assert response.headers['Content-Encoding'] == encoding
+    assert decompress(response.get_data()) == plain.get_data()
+    assert response.headers['ETag'] != plain.headers['ETag']
+
+    revalidated = client.get('/complaintFields', headers={
+        'Accept-Encoding': encoding, 'If-None-Match': response.headers['ETag']
+    })
+    assert revalidated.status_code == 304
+
+
+def test_identity_etag_revalidates_a_compressed_request(client):
+    etag = client.get('/complaintFields').headers['ETag']
+    response = client.get('/complaintFields', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert response.status_code == 304
+
+
+def test_languages_fall_back_to_english(client):
+    assert client.get('/complaintFields', headers={'Accept-Language': 'ar'}).get_data() == \
+        client.get('/complaintFields').get_data()
+
+
+def test_extra_catalogs_take_precedence(tmp_path):
+    path = tmp_path / 'catalogs.json'
+    path.write_text(json.dumps({"custom": {"en": {"from": "file"}}}))
+    client = make_client(CatalogCache(str(path), extra={"custom": {"en": {"from": "extra"}}}))
+    assert client.get('/custom').get_json()['data'] == {"from": "extra"}
+
+
+def test_reloads_when_the_file_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(catalog, 'CHECK_INTERVAL', 0)
+    path = tmp_path / 'catalogs.json'
+    path.write_text(json.dumps({"custom": {"en": {"version": 1}}}))
+    client = make_client(CatalogCache(str(path)))
+    first = client.get('/custom')
+    assert first.get_json()['data'] == {"version": 1}
+
+    path.write_text(json.dumps({"custom": {"en": {"version": 2}}}))
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    second = client.get('/custom', headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200
+    assert second.get_json()['data'] == {"version": 2}
+
+
+def test_bad_reload_keeps_the_previous_data(tmp_path, monkeypatch):
+    monkeypatch.setattr(catalog, 'CHECK_INTERVAL', 0)
+    path = tmp_path / 'catalogs.json'
+    path.write_text(json.dumps({"custom": {"en": {"version": 1}}}))
+    client = make_client(CatalogCache(str(path)))
+
+    path.write_text('{not json')
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert client.get('/custom').get_json()['data'] == {"version": 1}
@@ -0,0 +1,39 @@
+import sqlite3
+
+import pytest
+
+from complaints import ComplaintStore
+
+COMPLAINT = {"complainProvider": "20", "serviceType": "TF", "customerType": "I", "complainType": "1"}
+
+
+@pytest.fixture
+def store(tmp_path):
+    # A long flush interval puts everything submitted together in one batch
+    store = ComplaintStore(str(tmp_path / 'complaints.db'), flush_interval=0.2)
+    yield store
+    store.close()
+
+
+def test_add_and_search(store):
+    complaint_id = store.add(COMPLAINT, phone='96811111111')
+    store.add(dict(COMPLAINT, complainType='2'), phone='96822222222')
+
+    results = store.search(phone='96811111111')
+    assert [r['complainId'] for r in results] == [complaint_id]
+    assert results[0]['complainProvider'] == '20'
+    assert len(store.search(complainType='2')) == 1
+    assert len(store.search(limit=1)) == 1
+
+
+def test_bad_row_does_not_fail_its_batch(store):
+    pending = [
+        store.submit(COMPLAINT, phone='96811111111'),
+        store.submit(dict(COMPLAINT, complainProvider=['x']), phone='96811111111'),
+        store.submit(COMPLAINT, phone='96811111111'),
+    ]
+
+    assert pending[0].wait() and pending[2].wait()
+    with pytest.raises(sqlite3.Error):
+        pending[1].wait()
+    assert len(store.search(phone='96811111111')) == 2
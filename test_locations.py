@@ -0,0 +1,132 @@
+import pytest
+
+import locations
+from locations import LocationIndex, normalize, paginate
+
+TREE = [
+    {"code": "01", "en": "Muscat", "ar": "مسقط", "children": [
+        {"code": "11", "en": "Seeb", "ar": "السيب", "children": [
+            {"code": "111", "en": "Mabela", "ar": "المعبيلة"},
+            {"code": "112", "en": "Mawaleh", "ar": "الموالح"},
+        ]},
+        {"code": "12", "en": "Muttrah", "ar": "مطرح", "children": [
+            {"code": "121", "en": "Ruwi", "ar": "روي"},
+        ]},
+    ]},
+    {"code": "02", "en": "Musandam", "ar": "مسندم", "children": [
+        {"code": "21", "en": "Khasab", "ar": "خصب", "children": []},
+    ]},
+    {"code": "03", "en": "Al Dakhiliyah", "ar": "الداخلية", "children": [
+        {"code": "31", "en": "Nizwa", "ar": "نزوى", "children": [
+            {"code": "311", "en": "Birkat Al Mouz", "ar": "بركة الموز"},
+        ]},
+    ]},
+]
+
+
+@pytest.fixture(scope='module')
+def index():
+    return LocationIndex(TREE)
+
+
+def codes(index, indexes):
+    return [index.codes[i] for i in indexes]
+
+
+def test_breadth_first_ranges(index):
+    assert codes(index, index.level_range('governorate')) == ['01', '02', '03']
+    assert codes(index, index.level_range('wilaya')) == ['11', '12', '21', '31']
+    assert codes(index, index.level_range('village')) == ['111', '112', '121', '311']
+
+
+def test_children(index):
+    assert codes(index, index.children(None)) == ['01', '02', '03']
+    assert codes(index, index.children('01')) == ['11', '12']
+    assert codes(index, index.children('21')) == []
+    assert codes(index, index.children('111')) == []
+    with pytest.raises(KeyError):
+        index.children('99')
+
+
+def test_node(index):
+    assert index.node(index.by_code['12'], 'ar') == {
+        "code": "12", "desc": "مطرح", "level": "wilaya", "parentCode": "01", "childCount": 1
+    }
+    assert index.node(index.by_code['01'], 'fr')['desc'] == "Muscat"
+
+
+def test_paginate_bounds(index):
+    villages = index.level_range('village')
+    assert codes(index, paginate(villages, 1, 3)) == ['111', '112', '121']
+    assert codes(index, paginate(villages, 2, 3)) == ['311']
+    assert codes(index, paginate(villages, 3, 3)) == []
+
+
+def test_prefixes_sharing_an_edge_are_split(index):
+    # "mu" is shared by Muscat, Musandam and Muttrah, "mus" by the first two
+    assert codes(index, index.search('mu')) == ['01', '02', '12']
+    assert codes(index, index.search('mus')) == ['01', '02']
+    assert codes(index, index.search('musc')) == ['01']
+    assert codes(index, index.search('muscat')) == ['01']
+    assert codes(index, index.search('muscatx')) == []
+
+
+def test_later_words_match(index):
+    assert codes(index, index.search('mouz')) == ['311']
+    assert codes(index, index.search('dakh')) == ['03']
+
+
+def test_no_match(index):
+    assert index.search('zzz') == []
+    assert index.search('q') == []
+
+
+def test_level_filter_and_limit(index):
+    assert codes(index, index.search('m', level='village')) == ['111', '112', '311']
+    assert codes(index, index.search('m', level='governorate')) == ['01', '02']
+    assert codes(index, index.search('m', limit=2)) == ['01', '02']
+
+
+def test_arabic_normalization(index):
+    # Hamza on alef, diacritics, tatweel and ة/ه are folded together
+    assert normalize('الدَّاخِلـيّة') == normalize('الداخليه')
+    assert normalize('  Birkat   AL  Mouz ') == 'birkat al mouz'
+    assert codes(index, index.search('الداخليه')) == ['03']
+    assert codes(index, index.search('مسـقط')) == ['01']
+    assert codes(index, index.search('نزوي')) == ['31']
+
+
+def test_matches_are_capped_per_level(monkeypatch):
+    monkeypatch.setattr(locations, 'MAX_SUGGESTIONS', 3)
+    tree = [{"code": "01", "en": "Sur", "ar": "صور", "children": [
+        {"code": f"1{i}", "en": f"Sur {i}", "ar": f"صور {i}", "children": [
+            {"code": f"1{i}{j}", "en": f"Sur village {i}{j}"} for j in range(5)
+        ]} for i in range(5)
+    ]}]
+    index = LocationIndex(tree)
+    matches = index.search('sur', limit=20)
+    assert [index.level[i] for i in matches] == [0, 1, 1, 1, 2, 2, 2]
+    assert len(index.search('sur', level='village', limit=20)) == 3
+
+
+def test_search_agrees_with_a_scan(index):
+    def suffixes(i):
+        for name in (index.names['en'][i], index.names['ar'][i]):
+            words = normalize(name).split()
+            yield from (' '.join(words[n:]) for n in range(len(words)))
+
+    for prefix in ('m', 'ma', 'ru', 'al', 'n', 'ال', 'م', 'bir'):
+        expected = [
+            i for i in range(len(index.codes))
+            if any(key.startswith(normalize(prefix)) for key in suffixes(i))
+        ]
+        assert index.search(prefix, limit=20) == expected, prefix
+
+
+def test_deeper_than_village_is_rejected():
+    with pytest.raises(ValueError):
+        LocationIndex([{"code": "1", "en": "A", "children": [
+            {"code": "2", "en": "B", "children": [
+                {"code": "3", "en": "C", "children": [{"code": "4", "en": "D"}]}
+            ]}
+        ]}])
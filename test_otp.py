@@ -0,0 +1,123 @@
+import pytest
+
+import otp
+from otp import OtpStore, RateLimited
+
+PHONE = '96811111111'
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(otp.time, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def store(tmp_path, clock):
+    return OtpStore(str(tmp_path / 'otp.db'), mode='random')
+
+
+def test_code_is_single_use(store):
+    code = store.issue(PHONE)
+    assert len(code) == 6 and code.isdigit()
+    assert store.verify(PHONE, code)
+    assert not store.verify(PHONE, code)
+
+
+def test_new_code_replaces_the_old_one(store):
+    first = store.issue(PHONE)
+    second = store.issue(PHONE)
+    if first != second:
+        assert not store.verify(PHONE, first)
+    assert store.verify(PHONE, second)
+
+
+def test_codes_are_per_phone(store):
+    code = store.issue(PHONE)
+    assert not store.verify('96822222222', code)
+    assert store.verify(PHONE, code)
+
+
+def test_code_expires(store, clock):
+    code = store.issue(PHONE)
+    clock.now += otp.OTP_TTL
+    assert not store.verify(PHONE, code)
+
+
+def test_code_is_deleted_after_max_attempts(store, monkeypatch):
+    monkeypatch.setattr(otp, 'OTP_MAX_ATTEMPTS', 3)
+    code = store.issue(PHONE)
+    wrong = f"{(int(code) + 1) % 10 ** 6:06d}"
+    assert not store.verify(PHONE, wrong)
+    assert not store.verify(PHONE, wrong)
+    assert store.verify(PHONE, code)
+
+    code = store.issue(PHONE)
+    for _ in range(3):
+        assert not store.verify(PHONE, wrong)
+    assert not store.verify(PHONE, code)
+
+
+def test_send_limit_slides(store, clock, monkeypatch):
+    monkeypatch.setattr(otp, 'SEND_LIMIT', 2)
+    monkeypatch.setattr(otp, 'SEND_WINDOW', 100)
+    store.issue(PHONE)
+    clock.now += 30
+    store.issue(PHONE)
+    clock.now += 10
+    with pytest.raises(RateLimited) as e:
+        store.issue(PHONE)
+    # The first send leaves the window 60 seconds from now
+    assert e.value.retry_after == 61
+    store.issue('96822222222')
+
+    clock.now += 61
+    store.issue(PHONE)
+    with pytest.raises(RateLimited):
+        store.issue(PHONE)
+
+
+def test_verify_limit(store, clock, monkeypatch):
+    monkeypatch.setattr(otp, 'VERIFY_LIMIT', 2)
+    monkeypatch.setattr(otp, 'VERIFY_WINDOW', 50)
+    code = store.issue(PHONE)
+    store.verify(PHONE, '000000')
+    store.verify(PHONE, '000000')
+    with pytest.raises(RateLimited) as e:
+        store.verify(PHONE, code)
+    assert e.value.retry_after == 51
+
+    clock.now += 51
+    assert store.verify(PHONE, code)
+
+
+def test_static_mode(tmp_path, clock):
+    store = OtpStore(str(tmp_path / 'otp.db'), mode='static')
+    assert store.issue(PHONE) == otp.STATIC_OTP
+    assert store.verify(PHONE, otp.STATIC_OTP)
+    # Static codes are reusable, for testing
+    assert store.verify(PHONE, otp.STATIC_OTP)
+    assert not store.verify(PHONE, '000000')
+
+
+def test_store_is_shared_between_instances(tmp_path, clock):
+    path = str(tmp_path / 'otp.db')
+    code = OtpStore(path, mode='random').issue(PHONE)
+    assert OtpStore(path, mode='random').verify(PHONE, code)
+
+
+def test_deliver_writes_to_the_sink(tmp_path, monkeypatch):
+    monkeypatch.setattr(otp, 'SINK_FILE', None)
+    assert not otp.deliver(PHONE, '123456')
+    monkeypatch.setattr(otp, 'SINK_FILE', str(tmp_path / 'sink'))
+    assert otp.deliver(PHONE, '123456')
+    assert '"code": "123456"' in (tmp_path / 'sink').read_text()
@@ -0,0 +1,57 @@
+import base64
+import hashlib
+import hmac
+
+import time
+
+import pytest
+from flask import Flask
+
+from security import generate_hmac_key, generate_jwt_token, require_hmac, require_session
+
+KEY = 'session-key'
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+
+    @app.route('/signed', methods=['POST'])
+    @require_hmac
+    def signed():
+        return {"ok": True}
+
+    @app.route('/session', methods=['POST'])
+    @require_session
+    def session():
+        return {"ok": True}
+
+    return app.test_client()
+
+
+def sign(body, key=KEY):
+    return base64.b64encode(hmac.new(key.encode(), body, hashlib.sha256).digest()).decode()
+
+
+def test_valid_signature(client):
+    body = b'{"a": 1}'
+    response = client.post('/signed', data=body, headers={'Hmac-Key': KEY, 'Hmac': sign(body)})
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize('received', ['wrong', '\xe9abc'])
+def test_bad_signature_is_unauthorized(client, received):
+    response = client.post('/signed', data=b'{}', headers={'Hmac-Key': KEY, 'Hmac': received})
+    assert response.status_code == 401
+    assert response.get_json()['status'] == 401
+
+
+@pytest.mark.parametrize('sent_key, status', [(None, 200), ('current', 200), ('wrong', 401), ('\xe9abc', 401)])
+def test_session_hmac_key_must_match(client, sent_key, status):
+    issued_at = int(time.time())
+    headers = {'Authorization': f"Bearer {generate_jwt_token('96811111111', issued_at)}"}
+    if sent_key == 'current':
+        headers['Hmac-Key'] = generate_hmac_key('96811111111', issued_at)
+    elif sent_key is not None:
+        headers['Hmac-Key'] = sent_key
+    assert client.post('/session', headers=headers).status_code == status